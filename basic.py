@@ -0,0 +1,181 @@
+"""
+Load BASIC listings straight into the memory of a BASIC interpreter that is already loaded, tokenizing each line
+on the host the way the interpreter tokenizes a typed line, so the program is ready to RUN at once.
+
+The interpreter is found in memory by its code, so the addresses it keeps its pointers at are read from it rather
+than assumed. Only Processor Technology BASIC/5 (.bs5 listings) is known.
+"""
+import re
+
+from loader import write_memory
+
+# The BASIC/5 keyword table: each keyword follows its token, some tokens have more than one keyword, and FF ends
+# the table. Keywords are matched in table order, so >= comes before >.
+BASIC5_KEYWORDS_PATTERN = re.compile(rb'\x80LET\x81NEXT\x82IF[^\xFF]*\xFF')
+
+# The BASIC/5 NEW routine: LHLD program start, MVI M,1, SHLD end, LHLD end, INX H, SHLD variables, LHLD strings,
+# XCHG, LXI H,top, then a loop clearing memory up to the top and the resets of the string and stack pointers.
+BASIC5_NEW_PATTERN = re.compile(rb'\x2A(..)\x36\x01\x22(..)\x2A..\x23\x22(..)\x2A(..)\xEB\x21(..)'
+                                rb'\xAF\x12\xCD..\x13\xC2..\x2A..\x22..\x21(..)\x36\x00\x22(..)\x21..\x22(..)\xC9',
+                                re.DOTALL)
+
+# The end of the program is a line of length 1.
+END_OF_PROGRAM = 0x01
+
+# BASIC/5 reports LINE OVERFLOW ERROR for a typed line longer than this.
+MAX_LINE_LENGTH = 79
+
+LINE_NUMBER_PATTERN = re.compile(b' *([0-9]+) *')
+
+
+class BasicException(Exception):
+    pass
+
+
+class NoInterpreterException(BasicException):
+    """
+    Raised when there is no interpreter the module knows in memory.
+    """
+    pass
+
+
+def _word(memory, address):
+    return memory[address] + (memory[address + 1] << 8)
+
+
+class Basic5:
+    """
+    The tokenizer and program area of a BASIC/5 interpreter in memory.
+
+    A program is a list of lines in line number order, each a length byte counting the whole line, the line number,
+    the tokenized text and a CR, ended by a length of 1.
+    """
+
+    def __init__(self, memory):
+        keywords = BASIC5_KEYWORDS_PATTERN.search(memory)
+        new = BASIC5_NEW_PATTERN.search(memory)
+        if not keywords or not new:
+            raise NoInterpreterException('There is no BASIC/5 interpreter in memory')
+
+        # (keyword, token) in table order.
+        self.keywords = []
+        table = keywords.group(0)
+        position = 0
+        while table[position] != 0xFF:
+            end = position + 1
+            while table[end] < 0x80:
+                end += 1
+            self.keywords.append((table[position + 1:end], table[position]))
+            position = end
+
+        # Where the interpreter keeps its pointers.
+        addresses = [int.from_bytes(address, 'little') for address in new.groups()]
+        self.start_pointer, self.end_pointer, self.variables_pointer, self.strings_pointer, self.top_pointer, \
+            self.stack, self.stack_pointer, self.stack_base_pointer = addresses
+
+    def tokenize(self, text):
+        """
+        Tokenize the text of a line after its number. Nothing inside quotes is tokenized.
+
+        :return: bytearray
+        """
+        tokens = bytearray()
+        position = 0
+        quoted = False
+        while position < len(text):
+            c = text[position]
+            if c == 0x22:
+                quoted = not quoted
+            elif not quoted:
+                for keyword, token in self.keywords:
+                    if text.startswith(keyword, position):
+                        tokens.append(token)
+                        position += len(keyword)
+                        break
+                else:
+                    tokens.append(c)
+                    position += 1
+                continue
+            tokens.append(c)
+            position += 1
+        return tokens
+
+    def read_listing(self, path):
+        """
+        Tokenize a listing. As when it is typed in, a later line replaces an earlier one with the same number and a
+        line number on its own deletes the line.
+
+        :return: (dict of line number to tokenized text, list of the lines too long to type in)
+        """
+        lines = {}
+        too_long = []
+        with open(path, 'rb') as f:
+            for line in f:
+                line = line.rstrip(b'\r\n')
+                if len(line.strip()) == 0:
+                    continue
+                if len(line) > MAX_LINE_LENGTH:
+                    too_long.append(line.decode('latin1'))
+                    continue
+                match = LINE_NUMBER_PATTERN.match(line)
+                if not match or int(match.group(1)) > 0xFFFF:
+                    raise BasicException('No line number in {}: {}'.format(path, line.decode('latin1')))
+                number = int(match.group(1))
+                text = line[match.end():]
+                if len(text) > 0:
+                    lines[number] = self.tokenize(text)
+                else:
+                    lines.pop(number, None)
+        return lines, too_long
+
+    def program(self, lines):
+        """
+        :return: the program area for the lines, with the end of program mark
+        """
+        program = bytearray()
+        for number in sorted(lines):
+            text = lines[number]
+            program.append(len(text) + 4)
+            program += number.to_bytes(2, 'little')
+            program += text
+            program.append(0x0D)
+        program.append(END_OF_PROGRAM)
+        return program
+
+    def load(self, cpu, path):
+        """
+        Replace the program in memory with a listing, as NEW and typing the listing in would.
+
+        :return: list of the lines too long to type in, which are left out as the interpreter would
+        """
+        lines, too_long = self.read_listing(path)
+        program = self.program(lines)
+        memory = cpu.memory
+        start = _word(memory, self.start_pointer)
+        top = _word(memory, self.top_pointer)
+        end = start + len(program) - 1
+        if end >= top:
+            raise BasicException('{} does not fit in memory'.format(path))
+
+        # NEW clears everything from the strings up to the top of memory and resets the stacks.
+        strings = _word(memory, self.strings_pointer)
+        if strings <= top:
+            write_memory(cpu, strings, bytes(top + 1 - strings))
+        write_memory(cpu, self.strings_pointer, top.to_bytes(2, 'little'))
+        write_memory(cpu, self.stack, b'\x00')
+        write_memory(cpu, self.stack_pointer, self.stack.to_bytes(2, 'little'))
+        write_memory(cpu, self.stack_base_pointer, self.stack_pointer.to_bytes(2, 'little'))
+
+        write_memory(cpu, start, program)
+        write_memory(cpu, self.end_pointer, end.to_bytes(2, 'little'))
+        write_memory(cpu, self.variables_pointer, (end + 1).to_bytes(2, 'little'))
+        return too_long
+
+
+def load_listing(cpu, path):
+    """
+    Load a BASIC listing into the interpreter in memory.
+
+    :return: list of the lines left out for being too long
+    """
+    return Basic5(cpu.memory).load(cpu, path)
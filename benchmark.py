@@ -0,0 +1,425 @@
+"""
+Benchmarks for the 8080 CPU core and the display renderer.
+
+Three layers are measured:
+    micro   - tight loops of one opcode family (MOV, ALU, branches, stack).
+    macro   - real programs run headless (cpudiag, MS BASIC, SOLOS scrolling).
+    render  - Emulator._refresh and the character glyph construction.
+
+Results are printed as JSON. Use --save to store a baseline and --compare to check a run against one.
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json
+"""
+import contextlib
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import cpu
+import io8080
+import loader
+import nullmodem
+
+SOLOS = 'ROMs/solos.bin'
+ROM_ADDRESS = 0xC000
+TEXT_ADDRESS = 0xCC00
+CODE_ADDRESS = 0x0100
+
+# Strips the cursor bit from video memory so that the screen can be searched as text.
+SCREEN_TEXT = bytes(c & 0x7F for c in range(256))
+
+
+def _machine(rom=SOLOS):
+    """
+    Create a headless CPU and IO with the given ROM at C000.
+
+    :return: cpu.CPU
+    """
+    memory = bytearray(65536)
+    if rom:
+        with open(rom, 'rb') as f:
+            rom_bytes = f.read()
+        memory[ROM_ADDRESS:ROM_ADDRESS+len(rom_bytes)] = rom_bytes
+    machine = cpu.CPU(memory, io8080.IO())
+    machine.init_instruction_table()
+    return machine
+
+
+def _screen_has(machine, text):
+    return text in bytes(machine.memory[TEXT_ADDRESS:TEXT_ADDRESS+1024]).translate(SCREEN_TEXT)
+
+
+def _type(machine, text, max_slices=1000):
+    """
+    Feed keys through the keyboard port, one at a time as the program reads them.
+    """
+    io = machine.io
+    for c in text:
+        while len(io.keys) > 0:
+            machine.run()
+            max_slices -= 1
+            if max_slices == 0:
+                raise RuntimeError('Program stopped reading the keyboard.')
+        io.buffer_key(c)
+
+
+def _run_until_screen(machine, text, max_slices=10000):
+    """
+    Run whole slices until the text shows up in video memory.
+    """
+    for _ in range(max_slices):
+        machine.run()
+        if _screen_has(machine, text):
+            return
+    raise RuntimeError('{} never appeared on the screen.'.format(text))
+
+
+def _measure(run, repeat):
+    """
+    Time a workload several times and keep the fastest run.
+
+    :param run: function that returns the CPU it ran after doing the work
+    :return: dict of results
+    """
+    best = None
+    for _ in range(repeat):
+        machine, start_count, start_cycles, seconds = run()
+        instructions = machine._count - start_count
+        cycles = machine.cycle_count() - start_cycles
+        result = {
+            'seconds': seconds,
+            'instructions': instructions,
+            'instructions_per_sec': instructions / seconds,
+            'emulated_mhz': cycles / seconds / 1e6,
+        }
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+# ===========================
+# Micro benchmarks
+# ===========================
+
+def _jump(opcode, address):
+    return [opcode, address & 0xFF, address >> 8]
+
+
+def _mov_code():
+    # LXI H,2000h then register moves and memory moves.
+    prologue = [0x21, 0x00, 0x20]
+    body = [0x47, 0x48, 0x51, 0x5A, 0x63, 0x7C, 0x6F, 0x78, 0x7E, 0x77, 0x46, 0x70] * 8
+    return prologue, body
+
+
+def _alu_code():
+    # ADD, ADC, SUB, SBB, ANA, XRA, ORA, CMP, ADI, CPI, INR, DCR.
+    body = [0x80, 0x89, 0x92, 0x9B, 0xA0, 0xA9, 0xB2, 0xBB, 0xC6, 0x11, 0xFE, 0x40, 0x3C, 0x05] * 8
+    return [], body
+
+
+def _branch_code():
+    # JMP, JNZ, JZ, CALL and RET with both taken and not taken conditions. XRA A sets Z.
+    body = [0xAF]
+    for _ in range(8):
+        address = CODE_ADDRESS + len(body)
+        body += _jump(0xC3, address + 3)
+        body += _jump(0xC2, address + 6)
+        body += _jump(0xCA, address + 9)
+        body += _jump(0xCD, address + 15)
+        body += _jump(0xC3, address + 16)
+        body += [0xC9]
+    return [], body
+
+
+def _stack_code():
+    # PUSH and POP of every register pair.
+    prologue = [0x31, 0x00, 0x30]
+    body = [0xC5, 0xD5, 0xE5, 0xF5, 0xF1, 0xE1, 0xD1, 0xC1] * 8
+    return prologue, body
+
+
+MICRO = {
+    'mov': _mov_code,
+    'alu': _alu_code,
+    'branch': _branch_code,
+    'stack': _stack_code,
+}
+
+
+def micro_benchmark(code, slices, repeat):
+    def run():
+        machine = _machine(rom=None)
+        prologue, body = code()
+        # The loop body must start at CODE_ADDRESS for the branch targets to be right.
+        program = body + _jump(0xC3, CODE_ADDRESS)
+        machine.memory[CODE_ADDRESS:CODE_ADDRESS+len(program)] = bytes(program)
+        machine.memory[0:len(prologue)+3] = bytes(prologue + _jump(0xC3, CODE_ADDRESS))
+        start_count = machine._count
+        start_cycles = machine.cycle_count()
+        start = time.perf_counter()
+        for _ in range(slices):
+            machine.run()
+        return machine, start_count, start_cycles, time.perf_counter() - start
+    return _measure(run, repeat)
+
+
+# ===========================
+# Macro benchmarks
+# ===========================
+
+# cpudiag.ent has a conditional jump and a call the wrong way round, so a working 8080 takes the error exit after the
+# CPO/CPE call test at 02BD. These put back the JZ after the call test and the CNZ after the DAA of 9A.
+CPUDIAG_FIXES = {0x02BA: 0xCA, 0x05BF: 0xC4}
+
+# Where cpudiag goes once every test has passed, to print CPU IS OPERATIONAL.
+CPUDIAG_OPERATIONAL = 0x069B
+
+
+def _load_cpudiag(machine):
+    """
+    :return: start address
+    """
+    loader.load_ent(machine, 'TAPEs/bdos.ent')
+    start_address = loader.load_ent(machine, 'TAPEs/cpudiag.ent')
+    for address, opcode in CPUDIAG_FIXES.items():
+        machine.memory[address] = opcode
+    return start_address
+
+
+def cpudiag_benchmark(repeat, runs=200):
+    """
+    Run cpudiag through all of its tests until it exits through the warm boot vector at 0000.
+    """
+    def run():
+        machine = _machine(rom=None)
+        start_address = _load_cpudiag(machine)
+        program = bytes(machine.memory)
+
+        # Check that it passes before timing it, so that an error exit isn't what gets measured.
+        machine._pc = start_address
+        operational = False
+        while machine._pc != 0:
+            operational = operational or machine._pc == CPUDIAG_OPERATIONAL
+            machine.step()
+        if not operational:
+            raise RuntimeError('cpudiag took its error exit.')
+
+        start_count = machine._count
+        start_cycles = machine.cycle_count()
+        start = time.perf_counter()
+        for _ in range(runs):
+            machine.memory[:] = program
+            machine._pc = start_address
+            while machine._pc != 0:
+                machine.step()
+        return machine, start_count, start_cycles, time.perf_counter() - start
+    return _measure(run, repeat)
+
+
+def basic_benchmark(repeat):
+    """
+    Start MS BASIC under SOLOS and time a numeric FOR loop.
+    """
+    def run():
+        machine = _machine()
+        machine._pc = ROM_ADDRESS
+        _run_until_screen(machine, b'>')
+        start_address = loader.load_ent(machine, 'TAPEs/msbasic.ent')
+        machine._pc = start_address
+        _type(machine, b'\r\rY\r')
+        _run_until_screen(machine, b'Ok')
+        _type(machine, b'FOR I=1 TO 1000:A=A+I*1.5:NEXT:PRINT A')
+        start_count = machine._count
+        start_cycles = machine.cycle_count()
+        start = time.perf_counter()
+        machine.io.buffer_key(0x0D)
+        _run_until_screen(machine, b' 750750')
+        return machine, start_count, start_cycles, time.perf_counter() - start
+    return _measure(run, repeat)
+
+
+def scroll_benchmark(repeat):
+    """
+    Dump 32 lines of memory with SOLOS so that the whole screen scrolls.
+    """
+    def run():
+        machine = _machine()
+        machine._pc = ROM_ADDRESS
+        _run_until_screen(machine, b'>')
+        _type(machine, b'DU 0000 01FF')
+        start_count = machine._count
+        start_cycles = machine.cycle_count()
+        start = time.perf_counter()
+        machine.io.buffer_key(0x0D)
+        _run_until_screen(machine, b'01F0 ')
+        return machine, start_count, start_cycles, time.perf_counter() - start
+    return _measure(run, repeat)
+
+
+def null_modem_benchmark(repeat):
+    """
+    Dump 32 lines of memory with SOLOS out of one machine's serial port into another in terminal mode, both running
+    in turn on this thread.
+    """
+    def run():
+        sender = _machine()
+        receiver = _machine()
+        for machine in (sender, receiver):
+            machine._pc = ROM_ADDRESS
+            _run_until_screen(machine, b'>')
+        modem = nullmodem.NullModem()
+        modem.connect(sender.io)
+        modem.connect(receiver.io)
+        _type(receiver, b'TE\r')
+        _type(sender, b'SET O=1\r')
+        _type(sender, b'DU 0000 01FF')
+        start_count = sender._count
+        start_cycles = sender.cycle_count()
+        start = time.perf_counter()
+        sender.io.buffer_key(0x0D)
+        if not nullmodem.run_together([sender, receiver], until=lambda: _screen_has(receiver, b'01F0 '),
+                                      max_rounds=100000):
+            raise RuntimeError('The dump never reached the other machine.')
+        # The rates are the sender's. The receiver runs as many instructions alongside it.
+        return sender, start_count, start_cycles, time.perf_counter() - start
+    return _measure(run, repeat)
+
+
+# ===========================
+# Renderer benchmarks
+# ===========================
+
+def _emulator():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from emulator import Emulator
+    return Emulator(path=SOLOS, serial_device=None)
+
+
+def _frames(frames, seconds):
+    return {
+        'seconds': seconds,
+        'frames': frames,
+        'frames_per_sec': frames / seconds,
+    }
+
+
+def render_benchmarks(frames, repeat):
+    emu = _emulator()
+    memory = emu.cpu.memory
+    for i in range(1024):
+        memory[TEXT_ADDRESS+i] = 0x20 + i % 0x5F
+    results = {}
+
+    def best(name, setup):
+        fastest = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for frame in range(frames):
+                setup(frame)
+                emu._refresh()
+            seconds = time.perf_counter() - start
+            fastest = seconds if fastest is None else min(fastest, seconds)
+        results[name] = _frames(frames, fastest)
+
+    def unchanged(frame):
+        pass
+
+    def redraw(frame):
+        # Make every screen cell differ from what was last drawn.
+        emu.screen_buffer[:] = bytes(memory[TEXT_ADDRESS:TEXT_ADDRESS+1024])
+        for i in range(0, 1024):
+            emu.screen_buffer[i] ^= 1
+
+    def scroll(frame):
+        emu.io.start_display_line = frame % 16
+
+    best('refresh_unchanged', unchanged)
+    best('refresh_full', redraw)
+    best('refresh_scroll', scroll)
+
+    fastest = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        emu._create_characters()
+        seconds = time.perf_counter() - start
+        fastest = seconds if fastest is None else min(fastest, seconds)
+    results['create_characters'] = {'seconds': fastest, 'glyphs_per_sec': len(emu.characters) / fastest}
+    return results
+
+
+# ===========================
+# Baselines
+# ===========================
+
+RATES = ('instructions_per_sec', 'emulated_mhz', 'frames_per_sec', 'glyphs_per_sec')
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare every rate against a baseline.
+
+    :return: list of regression messages
+    """
+    regressions = []
+    for layer, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            old = baseline.get(layer, {}).get(name)
+            if old is None:
+                continue
+            for rate in RATES:
+                if rate in result and rate in old and result[rate] < old[rate] * (1 - tolerance):
+                    regressions.append('{}.{} {}: {:.4g} < {:.4g}'.format(layer, name, rate, result[rate], old[rate]))
+    return regressions
+
+
+def main():
+    arg_parser = ArgumentParser(description='Sol-20 emulator benchmarks')
+    arg_parser.add_argument('--layer', choices=('micro', 'macro', 'render'), action='append',
+                            help='Run only this layer. May be repeated.')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, the fastest is kept')
+    arg_parser.add_argument('--slices', type=int, default=20, help='CPU slices per micro benchmark')
+    arg_parser.add_argument('--frames', type=int, default=50, help='Frames per renderer benchmark')
+    arg_parser.add_argument('--save', help='Write the results to this baseline file')
+    arg_parser.add_argument('--compare', help='Compare against this baseline file')
+    arg_parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed slowdown before a regression')
+    args = arg_parser.parse_args()
+
+    layers = args.layer if args.layer else ('micro', 'macro', 'render')
+    results = {}
+
+    # Keep emulator chatter such as unknown port messages off stdout so that it only contains the JSON.
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        if 'micro' in layers:
+            results['micro'] = {name: micro_benchmark(code, args.slices, args.repeat) for name, code in MICRO.items()}
+        if 'macro' in layers:
+            results['macro'] = {
+                'cpudiag': cpudiag_benchmark(args.repeat),
+                'msbasic_loop': basic_benchmark(args.repeat),
+                'solos_scroll': scroll_benchmark(args.repeat),
+                'null_modem': null_modem_benchmark(args.repeat),
+            }
+        if 'render' in layers:
+            results['render'] = render_benchmarks(args.frames, args.repeat)
+
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import os
+import select
+import sys
+import time
+from io import FileIO
+
+import cpu
+import io8080
+import loader
+import throttle
+
+ROM_ADDRESS = 0xC000
+TEXT_ADDRESS = 0xCC00
+COLUMNS = 64
+ROWS = 16
+
+# Video characters as text: the cursor bit cleared and control characters shown as dots.
+SCREEN_TEXT = bytes((c & 0x7F) if 0x20 <= (c & 0x7F) < 0x7F else 0x2E for c in range(256))
+
+
+class ScreenStream:
+    """
+    Turns what a program writes to video memory into a stream of text.
+
+    The line the cursor is on is written out as it grows, and ended once the cursor moves to another line, so
+    scrolling and clearing the screen make no difference to the stream. The cursor is the character with the top
+    bit set.
+    """
+
+    def __init__(self, memory, output):
+        """
+        :param output: binary file the text is written to
+        """
+        self._memory = memory
+        self._output = output
+
+        # The physical row and column of the cursor, and the text of its row written out so far.
+        self._row = -1
+        self._column = 0
+        self._sent = b''
+
+        # A write that has not landed in memory yet.
+        self._pending = -1
+        self._written = False
+
+    def changed(self, address):
+        """
+        Called for each write to video memory, just before it is made.
+        """
+        if self._pending >= 0:
+            self._update(self._pending)
+        self._pending = address
+
+    def _update(self, address):
+        if self._memory[address] & 0x80:
+            offset = address - TEXT_ADDRESS
+            row = offset // COLUMNS
+            if row != self._row:
+                if self._row >= 0:
+                    self._send(self._text(COLUMNS))
+                    self._write(b'\n')
+                self._row = row
+                self._sent = b''
+            self._column = offset % COLUMNS
+
+    def _text(self, columns):
+        start = TEXT_ADDRESS + self._row * COLUMNS
+        return bytes(self._memory[start:start + columns]).translate(SCREEN_TEXT).rstrip(b' ')
+
+    def _send(self, text):
+        """
+        Write out what is new in the text of the cursor's row. A row that changed other than by growing is written
+        again after a CR.
+        """
+        if text.startswith(self._sent):
+            self._write(text[len(self._sent):])
+        else:
+            self._write(b'\r' + text)
+        self._sent = text
+
+    def _write(self, data):
+        if data:
+            self._output.write(data)
+            self._written = True
+
+    def flush(self):
+        """
+        Write out the cursor's row up to the cursor.
+        """
+        if self._pending >= 0:
+            self._update(self._pending)
+            self._pending = -1
+        if self._row >= 0:
+            text = self._text(self._column)
+            if text != self._sent:
+                self._send(text)
+        if self._written:
+            self._output.flush()
+            self._written = False
+
+    def close(self):
+        """
+        Write out the rest of the cursor's row and end it.
+        """
+        self.flush()
+        if self._sent:
+            self._output.write(b'\n')
+            self._output.flush()
+        self._row = -1
+        self._sent = b''
+
+
+class HeadlessMachine:
+    """
+    A Sol-20 with its ROM loaded and no pygame display, for frontends that run in a terminal. It has the same
+    cpu, io, idle, tracer, set_turbo and load_program as Emulator, so main.py can set either up.
+    """
+
+    # Longest time to sleep when the CPU is idle, in seconds.
+    IDLE_WAIT = 0.01
+
+    def __init__(self, path, serial_device=None, serial_paced=True):
+        """
+        :param serial_device: serial line for the Sol's serial port, as for IO.open_serial, or None for none
+        """
+        self.io = io8080.IO()
+        memory = bytearray(65536)
+        with open(path, 'rb') as f:
+            rom = f.read()
+        memory[ROM_ADDRESS:ROM_ADDRESS + len(rom)] = rom
+        self._cpu = cpu.CPU(memory, self.io)
+        self._cpu.init_instruction_table()
+        self.io.display_memory = memory
+
+        self.idle = None
+        self.tracer = None
+        self.throttle = throttle.Throttle(self._cpu)
+
+        if serial_device:
+            self.io.open_serial(serial_device, serial_paced)
+
+    @property
+    def cpu(self):
+        return self._cpu
+
+    def set_turbo(self, multiplier):
+        """
+        Run at a multiple of the real clock rate. None runs as fast as possible.
+        """
+        self.throttle.set_multiplier(multiplier)
+
+    def load_program(self, path, execute=False, address=None):
+        """
+        Copy an ENT, Intel HEX or raw binary file into memory, as Emulator.load_program does.
+        """
+        start_address = loader.load_program(self._cpu, path, address)
+        if execute:
+            for key in 'EX {:04X}\r'.format(start_address).encode():
+                self.io.buffer_key(key)
+        return start_address
+
+    def _sleep(self, fd=None):
+        """
+        Wait for input on fd or the idle wait to pass, then credit the CPU with the cycles it would have run.
+        """
+        start = time.perf_counter()
+        if fd is not None:
+            select.select([fd], [], [], self.IDLE_WAIT)
+        else:
+            time.sleep(self.IDLE_WAIT)
+        self.idle.wake(int((time.perf_counter() - start) * cpu.CLOCK_HZ))
+
+
+class Console(HeadlessMachine):
+    """
+    Runs a ROM with no display, for scripts and pipelines. What the program shows on the screen is written to an
+    output stream as text, and stdin is typed in through the keyboard port, a line at a time as the program asks
+    for it.
+
+    Once stdin has ended and every key has been read, the console stops the next time the program sits waiting
+    for input. Without an idle detector, as with --no-idle, --record or --replay, it stops once the screen has not
+    changed for QUIET_SLICES slices instead.
+    """
+
+    # Slices without a write to the screen that count as the program being done, when there is no idle detector.
+    QUIET_SLICES = 120
+
+    def __init__(self, path, output=None, serial_device=None, serial_paced=True):
+        """
+        :param output: binary file for the screen text, stdout by default
+        """
+        super().__init__(path, serial_device, serial_paced)
+
+        # Follow writes to video memory.
+        self.screen = ScreenStream(self._cpu.memory, output if output else sys.stdout.buffer)
+        self._cpu.watch_memory(TEXT_ADDRESS, TEXT_ADDRESS + COLUMNS * ROWS - 1)
+        self._check_memory_changed = self._cpu.check_memory_changed
+        self._cpu.check_memory_changed = self._memory_changed
+
+        self._stdin = None
+        self._stdin_blocking = True
+
+        # Writes to the screen, and the slices since the last one.
+        self._screen_writes = 0
+        self._quiet_slices = 0
+
+    def _memory_changed(self, address):
+        self._check_memory_changed(address)
+        if TEXT_ADDRESS <= address < TEXT_ADDRESS + COLUMNS * ROWS:
+            self.screen.changed(address)
+            self._screen_writes += 1
+
+    def _type_stdin(self):
+        fd = sys.stdin.fileno()
+        self._stdin_blocking = os.get_blocking(fd)
+        os.set_blocking(fd, False)
+        self._stdin = FileIO(fd, 'rb', closefd=False)
+        self.io.file_input(self._stdin)
+
+    def _finished(self):
+        return (self.io.paste is None or self.io.paste.done) and len(self.io.keys) == 0
+
+    def run(self):
+        """
+        Run until stdin is used up and the program is waiting for input again.
+        """
+        self._cpu._pc = ROM_ADDRESS
+        self.throttle.resync()
+
+        # A file given to paste is typed instead of stdin.
+        if self.io.paste is None:
+            self._type_stdin()
+        try:
+            while True:
+                writes = self._screen_writes
+                self._cpu.run()
+                self.screen.flush()
+                self.io.poll_printer()
+
+                if self.idle is None:
+                    if not self._finished() or self._screen_writes != writes:
+                        self._quiet_slices = 0
+                    else:
+                        self._quiet_slices += 1
+                        if self._quiet_slices >= self.QUIET_SLICES:
+                            break
+                elif self.idle.idle:
+                    if self._finished():
+                        break
+                    self._sleep(sys.stdin.fileno() if self._stdin and self.io.paste else None)
+
+                self.throttle.pace()
+        finally:
+            self.screen.close()
+            if self._stdin:
+                os.set_blocking(sys.stdin.fileno(), self._stdin_blocking)
@@ -8,8 +8,18 @@ class StackException(Exception):
     pass
 
 
+class EndSlice(Exception):
+    """
+    Raised by a device to end the current run slice early. The instruction raising it must be safe to execute again.
+    """
+    pass
+
+
 MAX_CYCLES = 0x411B
 
+# Clock rate of the Sol-20 8080.
+CLOCK_HZ = 2045000
+
 logger = logging.getLogger('cpu')
 
 parity_table = []
@@ -44,6 +54,7 @@ class CPU:
         self._interrupt_alternate = False
         self._count = 0
         self._cycles = 0
+        self._cycle_base = 0
         self._instructions = [0] * 0x100
         self.io = io
 
@@ -60,11 +71,12 @@ class CPU:
     
     def watch_memory(self, low_address, high_address):
         """
-        Sets a range of memory to watch for writes.
+        Sets a range of memory to watch for writes. Only a watched CPU checks its writes.
         """
         self._watch_memory_low = low_address
         self._watch_memory_high = high_address
         self._watch_memory_changed = False
+        self.write_byte = self._watched_write_byte
         
     def has_memory_changed(self):
         if self._watch_memory_changed:
@@ -77,6 +89,32 @@ class CPU:
         if address >= self._watch_memory_low and address <= self._watch_memory_high:
             self._watch_memory_changed = True
 
+    def cycle_count(self):
+        """
+        Total number of cycles executed since the CPU was created
+
+        :return: int
+        """
+        return self._cycle_base + self._cycles
+
+    def start_profiling(self):
+        """
+        Count executions and cycles per opcode and per address until the profiler returned is closed
+
+        :return: profiler.Profiler
+        """
+        from profiler import Profiler
+        return Profiler(self)
+
+    def start_tracing(self, capacity=65536, path=None):
+        """
+        Record the last instructions executed into a ring buffer until the tracer returned is closed
+
+        :return: tracer.Tracer
+        """
+        from tracer import Tracer
+        return Tracer(self, capacity, path)
+
     def reset(self):
         """
         Resets registers and flags
@@ -100,8 +138,20 @@ class CPU:
 
         :return:
         """
-        for _ in range(MAX_CYCLES):
-            self.step()
+        try:
+            for _ in range(MAX_CYCLES):
+                self.step()
+        except EndSlice:
+            pass
+
+    def skip_cycles(self, cycles):
+        """
+        Advance the cycle count without executing anything, for time spent idle
+
+        :param cycles: int
+        :return:
+        """
+        self._cycle_base += cycles
 
     def run_cycles(self, cycles):
         """
@@ -115,6 +165,21 @@ class CPU:
 
         return self._pc
 
+    def run_until_pc(self, address, max_slices=None):
+        """
+        Used for automation. Runs until the instruction at the address is about to execute.
+
+        :param address: int
+        :param max_slices: give up after this many slices of MAX_CYCLES instructions
+        :return: True if the address was reached
+        """
+        from debugger import Debugger
+        debugger = Debugger(self)
+        try:
+            return debugger.run_until_pc(address, max_slices)
+        finally:
+            debugger.close()
+
     def flag(self):
         """
         Used for debugging
@@ -146,9 +211,6 @@ class CPU:
 
         self._current_inst = self.fetch_rom_next_byte()
         
-        #if self._pc >= 0x0113 and self._pc < 0x12a2:
-        #    self.dump_inst() 
-        
         instruction = self._instructions[self._current_inst]
         if instruction is not None:
             instruction()
@@ -159,13 +221,17 @@ class CPU:
 
         # Check interrupt
         if self._cycles >= MAX_CYCLES:
-            self._cycles -= MAX_CYCLES
-            if self._interrupt:
-                if self._interrupt_alternate:
-                    self._call_interrupt(0x08)
-                else:
-                    self._call_interrupt(0x10)
-                self._interrupt_alternate = not self._interrupt_alternate
+            self._end_slice()
+
+    def _end_slice(self):
+        self._cycles -= MAX_CYCLES
+        self._cycle_base += MAX_CYCLES
+        if self._interrupt:
+            if self._interrupt_alternate:
+                self._call_interrupt(0x08)
+            else:
+                self._call_interrupt(0x10)
+            self._interrupt_alternate = not self._interrupt_alternate
 
     def _call_interrupt(self, address):
         self._stack_push(self._pc)
@@ -1439,6 +1505,11 @@ class CPU:
         return (self._memory[address + 1] << 8) + self._memory[address]
 
     def write_byte(self, address, data):
+        # Don't write to ROM.
+        if address < 0xC000 or address > 0xC7FF:
+            self._memory[address] = data & 0xFF
+
+    def _watched_write_byte(self, address, data):
         # Don't write to ROM.
         if address < 0xC000 or address > 0xC7FF:
             self.check_memory_changed(address)
@@ -0,0 +1,211 @@
+class BreakpointHit(Exception):
+    """
+    Raised out of CPU.step when a breakpoint or watchpoint triggers.
+    """
+
+    def __init__(self, kind, address, pc):
+        """
+        :param kind: 'pc', 'read', 'write', 'in' or 'out'
+        :param address: the breakpoint address, the memory address accessed or the port
+        :param pc: address of the instruction that triggered it
+        """
+        super().__init__('{} breakpoint at {} (PC={})'.format(kind, hex(address), hex(pc)))
+        self.kind = kind
+        self.address = address
+        self.pc = pc
+
+
+class Debugger:
+    """
+    PC breakpoints, memory read and write watchpoints and port I/O breakpoints.
+
+    Instrumented handlers are swapped into the CPU and IO instances only while something is armed that needs
+    them, so an unarmed CPU runs the plain handlers. PC breakpoints stop before the instruction executes. Watchpoints
+    and port breakpoints stop after the instruction that triggered them has completed.
+    """
+
+    def __init__(self, cpu):
+        self._cpu = cpu
+        self._io = cpu.io
+        self.breakpoints = set()
+        self.read_watchpoints = []
+        self.write_watchpoints = []
+        self.input_ports = set()
+        self.output_ports = set()
+
+        # Handlers replaced by instrumented ones, keyed by (instance, name).
+        self._saved = {}
+
+        # Watchpoint or port breakpoint seen during the current instruction.
+        self._hit = None
+
+        # A PC breakpoint just reported, so that execution can resume from it.
+        self._stopped_at = None
+
+    # ===========================
+    # Arming
+    # ===========================
+
+    def add_breakpoint(self, address):
+        self.breakpoints.add(address)
+        self._arm()
+
+    def remove_breakpoint(self, address):
+        self.breakpoints.discard(address)
+        self._arm()
+
+    def add_watchpoint(self, low_address, high_address=None, read=False, write=True):
+        """
+        Watch an inclusive range of memory for reads, writes or both.
+        """
+        if high_address is None:
+            high_address = low_address
+        if read:
+            self.read_watchpoints.append((low_address, high_address))
+        if write:
+            self.write_watchpoints.append((low_address, high_address))
+        self._arm()
+
+    def remove_watchpoint(self, low_address, high_address=None):
+        if high_address is None:
+            high_address = low_address
+        watchpoint = (low_address, high_address)
+        self.read_watchpoints = [w for w in self.read_watchpoints if w != watchpoint]
+        self.write_watchpoints = [w for w in self.write_watchpoints if w != watchpoint]
+        self._arm()
+
+    def add_port_breakpoint(self, port, input=True, output=True):
+        if input:
+            self.input_ports.add(port)
+        if output:
+            self.output_ports.add(port)
+        self._arm()
+
+    def remove_port_breakpoint(self, port):
+        self.input_ports.discard(port)
+        self.output_ports.discard(port)
+        self._arm()
+
+    def close(self):
+        """
+        Remove every breakpoint and restore the plain handlers.
+        """
+        self.breakpoints.clear()
+        self.read_watchpoints = []
+        self.write_watchpoints = []
+        self.input_ports.clear()
+        self.output_ports.clear()
+        self._arm()
+
+    def _arm(self):
+        cpu = self._cpu
+        reads = len(self.read_watchpoints) > 0
+        writes = len(self.write_watchpoints) > 0
+        inputs = len(self.input_ports) > 0
+        outputs = len(self.output_ports) > 0
+        self._swap(cpu, 'step', self._step, len(self.breakpoints) > 0 or reads or writes or inputs or outputs)
+        self._swap(cpu, 'read_byte', self._read_byte, reads)
+        self._swap(cpu, 'read_2bytes', self._read_2bytes, reads)
+        self._swap(cpu, 'write_byte', self._write_byte, writes)
+        self._swap(cpu, 'write_2bytes', self._write_2bytes, writes)
+        self._swap(self._io, 'input', self._input, inputs)
+        self._swap(self._io, 'output', self._output, outputs)
+
+    def _swap(self, instance, name, handler, armed):
+        key = (id(instance), name)
+        if armed and key not in self._saved:
+            self._saved[key] = (name in instance.__dict__, getattr(instance, name))
+            setattr(instance, name, handler)
+        elif not armed and key in self._saved:
+            had_instance_handler, original = self._saved.pop(key)
+            if had_instance_handler:
+                setattr(instance, name, original)
+            else:
+                delattr(instance, name)
+
+    def _original(self, instance, name):
+        return self._saved[(id(instance), name)][1]
+
+    # ===========================
+    # Instrumented handlers
+    # ===========================
+
+    def _step(self):
+        cpu = self._cpu
+        pc = cpu._pc
+        if pc in self.breakpoints:
+            if self._stopped_at == pc:
+                self._stopped_at = None
+            else:
+                self._stopped_at = pc
+                raise BreakpointHit('pc', pc, pc)
+        self._original(cpu, 'step')()
+        if self._hit:
+            kind, address = self._hit
+            self._hit = None
+            raise BreakpointHit(kind, address, pc)
+
+    def _watched(self, watchpoints, address, length):
+        for low, high in watchpoints:
+            if address <= high and address + length - 1 >= low:
+                return True
+        return False
+
+    def _read_byte(self, address):
+        if self._watched(self.read_watchpoints, address, 1):
+            self._hit = ('read', address)
+        return self._original(self._cpu, 'read_byte')(address)
+
+    def _read_2bytes(self, address):
+        if self._watched(self.read_watchpoints, address, 2):
+            self._hit = ('read', address)
+        return self._original(self._cpu, 'read_2bytes')(address)
+
+    def _write_byte(self, address, data):
+        if self._watched(self.write_watchpoints, address, 1):
+            self._hit = ('write', address)
+        self._original(self._cpu, 'write_byte')(address, data)
+
+    def _write_2bytes(self, address, data):
+        if self._watched(self.write_watchpoints, address, 2):
+            self._hit = ('write', address)
+        self._original(self._cpu, 'write_2bytes')(address, data)
+
+    def _input(self, port):
+        if port in self.input_ports:
+            self._hit = ('in', port)
+        return self._original(self._io, 'input')(port)
+
+    def _output(self, port, value):
+        if port in self.output_ports:
+            self._hit = ('out', port)
+        self._original(self._io, 'output')(port, value)
+
+    # ===========================
+    # Automation
+    # ===========================
+
+    def run_until_pc(self, address, max_slices=None):
+        """
+        Run whole slices until the CPU is about to execute the instruction at an address.
+
+        Other breakpoints that trigger first propagate as BreakpointHit.
+
+        :param max_slices: give up after this many CPU.run slices
+        :return: True if the address was reached
+        """
+        temporary = address not in self.breakpoints
+        self.add_breakpoint(address)
+        try:
+            slices = 0
+            while max_slices is None or slices < max_slices:
+                self._cpu.run()
+                slices += 1
+        except BreakpointHit as hit:
+            if hit.kind == 'pc' and hit.address == address:
+                return True
+            raise
+        finally:
+            if temporary:
+                self.remove_breakpoint(address)
+        return False
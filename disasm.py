@@ -0,0 +1,115 @@
+"""
+8080 disassembler.
+
+MNEMONICS holds a (format, length) pair for every opcode. The format takes the instruction's data byte or
+word as its only argument.
+"""
+
+REGISTERS = ('B', 'C', 'D', 'E', 'H', 'L', 'M', 'A')
+PAIRS = ('B', 'D', 'H', 'SP')
+CONDITIONS = ('NZ', 'Z', 'NC', 'C', 'PO', 'PE', 'P', 'M')
+ALU = ('ADD', 'ADC', 'SUB', 'SBB', 'ANA', 'XRA', 'ORA', 'CMP')
+ALU_IMMEDIATE = ('ADI', 'ACI', 'SUI', 'SBI', 'ANI', 'XRI', 'ORI', 'CPI')
+
+
+def _build_mnemonics():
+    # Undocumented opcodes execute as NOP in this emulator.
+    table = [('NOP', 1)] * 0x100
+
+    for p in range(4):
+        table[0x01 + p*16] = ('LXI ' + PAIRS[p] + ',{:04X}H', 3)
+        table[0x03 + p*16] = ('INX ' + PAIRS[p], 1)
+        table[0x09 + p*16] = ('DAD ' + PAIRS[p], 1)
+        table[0x0B + p*16] = ('DCX ' + PAIRS[p], 1)
+    table[0x02] = ('STAX B', 1)
+    table[0x12] = ('STAX D', 1)
+    table[0x22] = ('SHLD {:04X}H', 3)
+    table[0x32] = ('STA {:04X}H', 3)
+    table[0x0A] = ('LDAX B', 1)
+    table[0x1A] = ('LDAX D', 1)
+    table[0x2A] = ('LHLD {:04X}H', 3)
+    table[0x3A] = ('LDA {:04X}H', 3)
+
+    for r in range(8):
+        table[0x04 + r*8] = ('INR ' + REGISTERS[r], 1)
+        table[0x05 + r*8] = ('DCR ' + REGISTERS[r], 1)
+        table[0x06 + r*8] = ('MVI ' + REGISTERS[r] + ',{:02X}H', 2)
+        for s in range(8):
+            table[0x40 + r*8 + s] = ('MOV ' + REGISTERS[r] + ',' + REGISTERS[s], 1)
+        for s in range(8):
+            table[0x80 + r*8 + s] = (ALU[r] + ' ' + REGISTERS[s], 1)
+        table[0xC6 + r*8] = (ALU_IMMEDIATE[r] + ' {:02X}H', 2)
+        table[0xC7 + r*8] = ('RST {}'.format(r), 1)
+        table[0xC0 + r*8] = ('R' + CONDITIONS[r], 1)
+        table[0xC2 + r*8] = ('J' + CONDITIONS[r] + ' {:04X}H', 3)
+        table[0xC4 + r*8] = ('C' + CONDITIONS[r] + ' {:04X}H', 3)
+    table[0x76] = ('HLT', 1)
+
+    for i, name in enumerate(('RLC', 'RRC', 'RAL', 'RAR', 'DAA', 'CMA', 'STC', 'CMC')):
+        table[0x07 + i*8] = (name, 1)
+
+    for p, name in enumerate(('B', 'D', 'H', 'PSW')):
+        table[0xC1 + p*16] = ('POP ' + name, 1)
+        table[0xC5 + p*16] = ('PUSH ' + name, 1)
+
+    table[0xC3] = ('JMP {:04X}H', 3)
+    table[0xC9] = ('RET', 1)
+    table[0xCD] = ('CALL {:04X}H', 3)
+    table[0xD3] = ('OUT {:02X}H', 2)
+    table[0xDB] = ('IN {:02X}H', 2)
+    table[0xE3] = ('XTHL', 1)
+    table[0xE9] = ('PCHL', 1)
+    table[0xEB] = ('XCHG', 1)
+    table[0xF3] = ('DI', 1)
+    table[0xF9] = ('SPHL', 1)
+    table[0xFB] = ('EI', 1)
+    return table
+
+
+MNEMONICS = _build_mnemonics()
+
+
+def mnemonic(opcode):
+    """
+    Name of an opcode without its data, for example 'MOV A,M', 'MVI B' or 'JNZ'.
+    """
+    return MNEMONICS[opcode][0].split('{')[0].rstrip(', ')
+
+
+def format_instruction(opcode, data=0):
+    """
+    Format an instruction given its opcode and data byte or word.
+    """
+    return MNEMONICS[opcode][0].format(data)
+
+
+def disassemble(memory, address):
+    """
+    Disassemble the instruction at an address.
+
+    :return: (text, length)
+    """
+    opcode = memory[address]
+    length = MNEMONICS[opcode][1]
+    data = 0
+    if length == 2:
+        data = memory[(address + 1) & 0xFFFF]
+    elif length == 3:
+        data = memory[(address + 1) & 0xFFFF] + (memory[(address + 2) & 0xFFFF] << 8)
+    return format_instruction(opcode, data), length
+
+
+def disassemble_range(memory, start, end):
+    """
+    Disassemble the instructions from start up to but not including end.
+
+    :return: list of lines
+    """
+    lines = []
+    address = start
+    while address < end:
+        text, length = disassemble(memory, address)
+        code = ' '.join('{:02X}'.format(memory[(address + i) & 0xFFFF]) for i in range(length))
+        lines.append('{:04X}  {:<9} {}'.format(address, code, text))
+        address += length
+    return lines
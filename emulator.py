@@ -1,8 +1,14 @@
 import pygame
 import io8080
 import cpu
+import basic
+import keywatch
+import loader
+import throttle
 import sys
+import time
 import serial
+import tkinter.filedialog
 
 class Emulator:
     """
@@ -18,10 +24,21 @@ class Emulator:
     GREEN = 0x00FF00
     AMBER = 0xFFBF00
     CAPTION_FORMAT = 'Sol-20 ({})'
+    TURBO_CAPTION_FORMAT = 'Sol-20 ({}) turbo {}'
+    
+    # Longest time to sleep when the CPU is idle, in milliseconds.
+    IDLE_WAIT_MS = 50
+    
+    # Posted to wake the main loop when input arrives from another thread.
+    INPUT_EVENT = pygame.USEREVENT
     
     
 
-    def __init__(self, path=None):
+    def __init__(self, path=None, serial_device=io8080.IO.SERIAL_DEVICE, serial_paced=True):
+        """
+        :param serial_device: serial line for the Sol's serial port, as for IO.open_serial, or None for none
+        :param serial_paced: run a pseudo-terminal or TCP serial line at the switches.cfg baud rate
+        """
         self.io = io8080.IO()
         
         if path:
@@ -32,12 +49,26 @@ class Emulator:
                 memory[self.ROM_ADDRESS:self.ROM_ADDRESS+len(memoryBytes)] = bytearray(memoryBytes)
             self._cpu = cpu.CPU(memory, self.io)
             self._cpu.init_instruction_table()
+            self.io.display_memory = memory
 
         else:
             self._cpu = None
 
         self._path = path
         
+        # Instruction tracer dumped with Alt-T when tracing is on.
+        self.tracer = None
+        
+        # Paces the CPU to real time. F12 steps through the turbo settings.
+        self.throttle = throttle.Throttle(self._cpu)
+        
+        # Ends slices early when a key arrives and once its echo is on the screen.
+        self.key_watcher = keywatch.KeyWatcher(self._cpu, self._key_event_waiting) if self._cpu else None
+        
+        # Idle loop detector. When set the main loop sleeps while the CPU is polling for input.
+        self.idle = None
+        self.io.input_listener = self._input_arrived
+        
         # Class variables.
         self.character_width = 10
         self.character_height = 30                       
@@ -215,64 +246,12 @@ class Emulator:
             # Save the sense switch settings.
             self.io.sense_switch = sense_switch
             
-        # Create the display characters based on the original Sol-20 ROM.
-        self.characters = []
-        fore = self.char_foreground_color
-        back = self.char_background_color
-        if self.invert_screen == True:
-            fore = self.char_background_color
-            back = self.char_foreground_color
+        # Open the serial port with the switch settings.
+        if serial_device:
+            self.io.open_serial(serial_device, serial_paced)
             
-        with open(self.rom_filename, 'rb') as f:
-            romBytes = f.read()
-            # Create the characters from the Sol-20 ROM.
-            for c in range(0,128):
-                image = pygame.Surface((self.character_width, self.character_height), depth=self.color_depth)
-                image.fill(back)
-                if c in (0x67, 0x6A, 0x70, 0x71, 0x79, 0x2C, 0x3B):
-                    # Characters with descenders.
-                    for row in range(5,14):
-                        byte = romBytes[c*16+row-5]
-                        bit = 0x80
-                        for col in range(0,8):
-                            if byte & bit > 0:
-                                image.set_at((col+1, row*2+1), fore)
-                                image.set_at((col+1, row*2+2), fore)
-                            bit = bit >> 1
-                else:
-                    for row in range(2,14):
-                        byte = romBytes[c*16+row-2]
-                        bit = 0x80
-                        for col in range(0,8):
-                            if byte & bit > 0:
-                                image.set_at((col+1, row*2), fore)
-                                image.set_at((col+1, row*2+1), fore)
-                            bit = bit >> 1
-                self.characters.append(image)
-                
-            # Create inverted characters from the Sol-20 ROM.
-            for c in range(0,128):
-                image = pygame.Surface((self.character_width, self.character_height), depth=self.color_depth)
-                image.fill(fore)
-                if c in (0x67, 0x6A, 0x70, 0x71, 0x79, 0x2C, 0x3B):
-                    for row in range(5,14):
-                        byte = romBytes[c*16+row-5]
-                        bit = 0x80
-                        for col in range(0,8):
-                            if byte & bit > 0:
-                                image.set_at((col+1, row*2+1), back)
-                                image.set_at((col+1, row*2+2), back)
-                            bit = bit >> 1
-                else:
-                    for row in range(2,14):
-                        byte = romBytes[c*16+row-2]
-                        bit = 0x80
-                        for col in range(0,8):
-                            if byte & bit > 0:
-                                image.set_at((col+1, row*2), back)
-                                image.set_at((col+1, row*2+1), back)
-                            bit = bit >> 1
-                self.characters.append(image)
+        # Create the display characters based on the original Sol-20 ROM.
+        self._create_characters()
                 
         # Have to map PyGame keys to ASCII characters.
         self.keymap = {
@@ -359,7 +338,7 @@ class Emulator:
             pygame.mouse.set_visible(0)
         else:
             self.screen = pygame.display.set_mode(display_size)
-        pygame.display.set_caption(self.CAPTION_FORMAT.format(self._path))
+        self._update_caption()
         
         
         # Clear the screen.
@@ -377,6 +356,87 @@ class Emulator:
         # Define a buffer with the current screen contents.
         self.screen_buffer = bytearray(1024)
         
+    def _create_characters(self):
+        """
+        Build the normal and inverted character images from the character generator ROM.
+
+        """
+        self.characters = []
+        fore = self.char_foreground_color
+        back = self.char_background_color
+        if self.invert_screen == True:
+            fore = self.char_background_color
+            back = self.char_foreground_color
+            
+        with open(self.rom_filename, 'rb') as f:
+            romBytes = f.read()
+            # Create the characters from the Sol-20 ROM.
+            for c in range(0,128):
+                image = pygame.Surface((self.character_width, self.character_height), depth=self.color_depth)
+                image.fill(back)
+                if c in (0x67, 0x6A, 0x70, 0x71, 0x79, 0x2C, 0x3B):
+                    # Characters with descenders.
+                    for row in range(5,14):
+                        byte = romBytes[c*16+row-5]
+                        bit = 0x80
+                        for col in range(0,8):
+                            if byte & bit > 0:
+                                image.set_at((col+1, row*2+1), fore)
+                                image.set_at((col+1, row*2+2), fore)
+                            bit = bit >> 1
+                else:
+                    for row in range(2,14):
+                        byte = romBytes[c*16+row-2]
+                        bit = 0x80
+                        for col in range(0,8):
+                            if byte & bit > 0:
+                                image.set_at((col+1, row*2), fore)
+                                image.set_at((col+1, row*2+1), fore)
+                            bit = bit >> 1
+                self.characters.append(image)
+                
+            # Create inverted characters from the Sol-20 ROM.
+            for c in range(0,128):
+                image = pygame.Surface((self.character_width, self.character_height), depth=self.color_depth)
+                image.fill(fore)
+                if c in (0x67, 0x6A, 0x70, 0x71, 0x79, 0x2C, 0x3B):
+                    for row in range(5,14):
+                        byte = romBytes[c*16+row-5]
+                        bit = 0x80
+                        for col in range(0,8):
+                            if byte & bit > 0:
+                                image.set_at((col+1, row*2+1), back)
+                                image.set_at((col+1, row*2+2), back)
+                            bit = bit >> 1
+                else:
+                    for row in range(2,14):
+                        byte = romBytes[c*16+row-2]
+                        bit = 0x80
+                        for col in range(0,8):
+                            if byte & bit > 0:
+                                image.set_at((col+1, row*2), back)
+                                image.set_at((col+1, row*2+1), back)
+                            bit = bit >> 1
+                self.characters.append(image)
+
+    @property
+    def cpu(self):
+        return self._cpu
+    
+    def set_turbo(self, multiplier):
+        """
+        Run at a multiple of the real clock rate. None runs as fast as possible.
+        
+        """
+        self.throttle.set_multiplier(multiplier)
+        self._update_caption()
+        
+    def _update_caption(self):
+        if self.throttle.multiplier == 1:
+            pygame.display.set_caption(self.CAPTION_FORMAT.format(self._path))
+        else:
+            pygame.display.set_caption(self.TURBO_CAPTION_FORMAT.format(self._path, self.throttle.describe()))
+        
     # Blit the character passed to the display screen at the coordinates passed.
     def _blit_character(self, c, x, y):
         buffer_pos = int(x/self.character_width) + int((y/self.character_height)*64)
@@ -478,6 +538,24 @@ class Emulator:
         if key == pygame.K_l and mod & pygame.KMOD_ALT:
             self.io.prompt_file()
             return 0
+        # Load an ENT or Intel HEX file straight into memory, and run it with shift.
+        if key == pygame.K_e and mod & pygame.KMOD_ALT:
+            self._prompt_program(mod & pygame.KMOD_SHIFT > 0)
+            return 0
+        # Load a BASIC listing straight into the interpreter.
+        if key == pygame.K_b and mod & pygame.KMOD_ALT:
+            self._prompt_basic()
+            return 0
+        # Dump the instruction trace.
+        if key == pygame.K_t and mod & pygame.KMOD_ALT:
+            if self.tracer:
+                self.tracer.dump()
+            return 0
+        # Step through the turbo settings.
+        if key == pygame.K_F12:
+            self.throttle.next_multiplier()
+            self._update_caption()
+            return 0
         keys = self.keymap.get(key)
         if keys != None:
             if mod & pygame.KMOD_CTRL > 0:
@@ -494,6 +572,82 @@ class Emulator:
             self.io.tape_head = 0
         return key
          
+    def load_program(self, path, execute=False, address=None):
+        """
+        Copy an ENT, Intel HEX or raw binary file into memory without going through the virtual tape.
+        
+        :param execute: type an EX command for its execution address, so SOLOS starts it once it is at the prompt
+        :param address: load address of a raw binary file
+        """
+        start_address = loader.load_program(self._cpu, path, address)
+        if execute:
+            for key in 'EX {:04X}\r'.format(start_address).encode():
+                self.io.buffer_key(key)
+        return start_address
+        
+    def _prompt_program(self, execute):
+        top = tkinter.Tk()
+        top.withdraw()
+        file_name = tkinter.filedialog.askopenfilename(parent=top, title='Load a program:', initialdir='TAPEs',
+                                                       filetypes=[('Programs', '*.ent *.ihx *.ihex'),
+                                                                  ('All files', '*')])
+        top.destroy()
+        if file_name:
+            try:
+                self.load_program(file_name, execute)
+            except (OSError, ValueError, loader.LoaderException) as e:
+                print(e)
+         
+    def load_basic(self, path):
+        """
+        Load a BASIC listing straight into the BASIC interpreter in memory, ready to RUN. When the interpreter is not
+        one the basic module knows, such as Extended Cassette BASIC, the listing is typed in instead.
+        """
+        try:
+            too_long = basic.load_listing(self._cpu, path)
+        except basic.NoInterpreterException as e:
+            print(e)
+            self.io.paste_file(path)
+            return
+        except basic.BasicException as e:
+            # A listing that doesn't fit or has a bad line would fail the same way typed in.
+            print(e)
+            return
+        for line in too_long:
+            print("LINE OVERFLOW ERROR: " + line)
+         
+    def _prompt_basic(self):
+        top = tkinter.Tk()
+        top.withdraw()
+        file_name = tkinter.filedialog.askopenfilename(parent=top, title='Load a BASIC listing:', initialdir='TAPEs',
+                                                       filetypes=[('BASIC listings', '*.bs5 *.ecb'),
+                                                                  ('All files', '*')])
+        top.destroy()
+        if file_name:
+            try:
+                self.load_basic(file_name)
+            except OSError as e:
+                print(e)
+         
+    def _key_event_waiting(self):
+        return pygame.event.peek(pygame.KEYDOWN)
+         
+    def _input_arrived(self):
+        # Wake the main loop if it is sleeping.
+        if self.idle and self.idle.idle:
+            pygame.event.post(pygame.event.Event(self.INPUT_EVENT))
+            
+    def _sleep(self):
+        """
+        Block until there is an event or the idle wait passes, then credit the CPU with the cycles it would have run.
+        
+        """
+        start = time.perf_counter()
+        event = pygame.event.wait(self.IDLE_WAIT_MS)
+        if event.type != pygame.NOEVENT:
+            self._handle(event)
+        self.idle.wake(int((time.perf_counter() - start) * cpu.CLOCK_HZ))
+         
     def _handle(self, event):
         """
         Get key presses and add them to a key buffer.
@@ -504,7 +658,7 @@ class Emulator:
         if event.type == pygame.KEYDOWN:
             key = self.process_key(event.key, event.mod)
             if key != 0:
-                self.io.buffer_key(key)
+                self.io.buffer_key(key, self.key_watcher.event_time() if self.key_watcher else None)
 
     def run(self):
         """
@@ -519,6 +673,7 @@ class Emulator:
 
         # The ROM is at C000.
         self._cpu._pc = 0xC000
+        self.throttle.resync()
         
         # Main loop.
         while True:
@@ -526,6 +681,11 @@ class Emulator:
             for event in pygame.event.get():
                 self._handle(event)
             
+            # The Local key asks for a file to paste from its GPIO thread.
+            if self.io.prompt_requested:
+                self.io.prompt_requested = False
+                self.io.prompt_file()
+            
             # This will run the CPU for about 4K cycles.
             self._cpu.run()
             
@@ -539,3 +699,12 @@ class Emulator:
                 if self.blinking_cursor:
                     self.blink.resume()
                 self.cursor_position = -1
+            
+            self.io.poll_printer()
+            
+            # Sleep while the program is waiting for input.
+            if self.idle and self.idle.idle:
+                self._sleep()
+            
+            # Keep to the speed of a real Sol-20 times the turbo setting.
+            self.throttle.pace()
@@ -0,0 +1,83 @@
+from cpu import EndSlice
+
+# Keyboard, tape and parallel status, and serial status. Reading them again has no side effects.
+STATUS_PORTS = frozenset((0xFA, 0xF8))
+
+IN_OPCODE = 0xDB
+
+
+class IdleDetector:
+    """
+    Detects a program spinning on a status port, like SOLOS waiting for a key, so that the host can sleep.
+
+    A polling loop is the same IN instruction reading the same value from the same status port at a constant,
+    short cycle interval. Data ports are never counted, as running their IN again would read them twice. Once seen
+    often enough the detector ends the CPU slice with the PC back on the IN instruction and sets idle. The run loop
+    then blocks until something happens and calls wake.
+    """
+
+    def __init__(self, cpu, repeats=32, max_loop_cycles=400):
+        """
+        :param repeats: polls of the same status before the loop counts as idle
+        :param max_loop_cycles: longest loop, in cycles between polls, that can be idle
+        """
+        self._cpu = cpu
+        self._io = cpu.io
+        self.repeats = repeats
+        self.max_loop_cycles = max_loop_cycles
+        self.idle = False
+
+        # The last poll seen.
+        self._pc = -1
+        self._port = -1
+        self._value = -1
+        self._delta = -1
+        self._last_cycle = 0
+        self._count = 0
+
+        self._input = self._io.input
+        self._io.input = self.input
+
+    def input(self, port):
+        value = self._input(port)
+        if port not in STATUS_PORTS:
+            self._count = 0
+            self._pc = -1
+            return value
+        cpu = self._cpu
+        pc = cpu._pc
+        now = cpu._cycle_base + cpu._cycles
+        delta = now - self._last_cycle
+        self._last_cycle = now
+        if pc == self._pc and port == self._port and value == self._value and delta == self._delta \
+                and delta <= self.max_loop_cycles:
+            self._count += 1
+            if self._count >= self.repeats and cpu._memory[(pc - 2) & 0xFFFF] == IN_OPCODE:
+                # Rewind to the IN instruction. It runs again once the host wakes up.
+                self._count = 0
+                self.idle = True
+                cpu._pc = (pc - 2) & 0xFFFF
+                raise EndSlice()
+        else:
+            self._count = 0
+            self._pc = pc
+            self._port = port
+            self._value = value
+            self._delta = delta
+        return value
+
+    def wake(self, cycles=0):
+        """
+        Leave the idle state after the host slept.
+
+        :param cycles: CPU cycles that would have run while sleeping
+        """
+        self.idle = False
+        self._cpu.skip_cycles(cycles)
+        self._last_cycle += cycles
+
+    def close(self):
+        """
+        Restores the original input handler.
+        """
+        self._io.input = self._input
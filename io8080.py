@@ -1,7 +1,15 @@
+import os
 import sys
 import serial  
 import tkinter.filedialog
 
+import keyqueue
+import loader
+import paste
+import printer
+import serialport
+import virtualtape
+
 HAS_KEYBOARD = False
 try:
     import RPi.GPIO as GPIO
@@ -55,8 +63,8 @@ class IO:
     # Status of the Local key.
     LOCAL_MODE = False
     
-    # Serial port if one is present.
-    ser = None
+    # Serial port opened by default.
+    SERIAL_DEVICE = '/dev/ttyUSB0'
     
     def calculate_crc(self, d, c):
         # SUB C  
@@ -121,162 +129,149 @@ class IO:
         tape.append(crc)
         
     def write_data_with_crc(self, tape, data):
-        crc_count = 0
-        crc = 0
-        for b in data:
-            crc = self.add_tape_byte(tape, b, crc)
-            crc_count += 1
-            if crc_count == 256:
-                tape.append(crc)
-                crc_count = 0
-                crc = 0
+        # A CRC follows every full block of 256 bytes.
+        full = len(data) - len(data) % 256
+        for i in range(0, full, 256):
+            block = data[i:i+256]
+            tape.extend(block)
+            tape.append(virtualtape.block_crc(block))
                                         
         # Write the last CRC.
-        tape.append(crc)
+        tape.extend(data[full:])
+        tape.append(virtualtape.block_crc(data[full:]))
         
-    def load_virtual_tape(self, f, tape):
+    def emit_program(self, tape, file_name, start_address, exec_address, data):
+        """
+        Append a program read from a file to a virtual tape as a header and data blocks.
+        """
+        # Program name can only be 5 characters.
+        name = file_name.split(".")[0].upper()
+        name = name[0:5]
+        self.emit_header(tape, name, ord('C'), '{:04X}'.format(len(data)), '{:04X}'.format(start_address),
+                         '{:04X}'.format(exec_address))
+        self.write_data_with_crc(tape, data)
+        
+    def read_tape_entries(self, f):
+        """
+        Split a virtual tape file into its programs. Each is a list of lines: an F line, or an H line followed by
+        its D lines.
+        """
+        entries = []
+        for line in f:
+            # Remove leading and trailing white spaces.
+            line = line.strip().upper()
             
-            # Process all the  D lines in a block.
-            processing_data = False
-            data_bytes = bytearray()
- 
-            # For each line.
-            for line in f:
-                # Remove leading and trailing white spaces.
-                line = line.strip().upper()
-                
-                # Skip empty lines and comments.
-                if len(line) == 0 or line[0] == ";":
-                    continue
+            # Skip empty lines and comments.
+            if len(line) == 0 or line[0] == ";":
+                continue
+            
+            if line[0] in ("F", "H"):
+                entries.append([line])
+            elif line[0] == "D":
+                # Data lines belong to the program before them.
+                if len(entries) == 0:
+                    entries.append([])
+                entries[-1].append(line)
+        return entries
+    
+    def encode_tape_entry(self, entry, tape, directory="TAPEs"):
+        """
+        Append one program from read_tape_entries to a virtual tape as SOLOS would have recorded it.
+        
+        :param directory: where the files named on F lines are, the directory of the tape file
+        """
+        data_bytes = bytearray()
+        processing_data = False
+        for line in entry:
+            # Add a program from an external file.
+            if line[0] == "F":     
+                file_name = line.split(" ")[1].lower()
+                if file_name.endswith(".ent") or file_name.endswith(loader.INTEL_HEX_EXTENSIONS):
+                    exec_address, blocks = loader.read_program(os.path.join(directory, file_name))
+                    start_address, data = loader.image(blocks)
+                    self.emit_program(tape, file_name, start_address, exec_address, data)
+                elif file_name.endswith(".bin"):
+                    # A raw image, followed by its load address and optionally its execution address.
+                    tokens = line.split()
+                    start_address = int(tokens[2], 16)
+                    exec_address = int(tokens[3], 16) if len(tokens) > 3 else start_address
+                    start_address, blocks = loader.read_bin(os.path.join(directory, file_name), start_address)
+                    self.emit_program(tape, file_name, start_address, exec_address, blocks[0][1])
+                elif file_name.endswith(".tap") or file_name.endswith(".hex"):
+                    # Bytes saved from the tape port. Older saves have a .hex extension.
+                    with open(os.path.join(directory, file_name), 'rb') as f:
+                        tape.extend(f.read(-1))
+                elif file_name.endswith(".wav"):
+                    # A KCS or CUTS recording, optionally followed by its speed.
+                    import kcs
+                    tokens = line.split()
+                    baud = int(tokens[2]) if len(tokens) > 2 else None
+                    tape.extend(kcs.decode(os.path.join(directory, file_name), baud))
+                        
+            # Process headers.
+            if line[0] == "H":      
                 
-                # Write out the data to the virtual tape.
-                if processing_data and line[0] != "D":
-                    self.write_data_with_crc(tape, data_bytes)
-                    data_bytes.clear()
-                    processing_data = False
+                # Add leading nulls plus nulls terminator.
+                for i in range(0,30):
+                    tape.append(0x00)
+                tape.append(0x01)
+                      
+                # Parse out the command line arguments.
+                tokens = line.split()
+                name = tokens[1]
+                program_type = int(tokens[2], 16)
+                data_size = tokens[3]
+                start_address = tokens[4]
+                exec_address = tokens[5]
+                self.emit_header(tape, name, program_type, data_size, start_address, exec_address)
                 
-                # Ignore all but the header, data, and file lines.
-                if line[0] in ("S", "R" , "L", "B", "C"):                    
-                    continue
+            # Process data lines.
+            if line[0] == "D":
                 
-                # Add a program from an external file.
-                if line[0] == "F":     
-                    file_name = line.split(" ")[1].lower()
-                    if file_name.endswith(".ent"):
-                        with open("TAPEs/"+file_name, 'r') as f:
-                            file_bytes = bytearray()
-                            data_count = 0
-                            old_address = 0
-                           
-                            # For each line.
-                            for inline in f:
-                                inline = inline.strip()
-                                if len(inline) == 0:
-                                    continue
-                                if inline[0] == "E":
-                                    start_address = inline.split(" ")[1].strip().zfill(4)
-                                else:
-                                    # Assume bytes are contiguous.
-                                    tokens = inline.split(":")
-                                    address = int(tokens[0], 16)
-                                    if old_address != 0 and old_address != address:
-                                        for i in range(old_address,address):
-                                            file_bytes.append(int(0))
-                                            data_count += 1
-                                    data = tokens[1].strip().split(" ")
-                                    for i in range(0, len(data)): 
-                                        file_bytes.append(int(data[i].replace('/', ''), 16))
-                                        data_count += 1
-                                        address += 1
-                                    old_address = address
-                            # Program name can only be 5 characters.
-                            name = file_name.split(".")[0].upper()
-                            name = name[0:5]
-                            data_size = hex(data_count)[2:].zfill(4)
-                            self.emit_header(tape, name, ord('C'), data_size, start_address, start_address)
-                            
-                            # Now write the data.
-                            self.write_data_with_crc(tape, file_bytes)                       
-                    elif file_name.endswith(".hex"):
-                        with open("TAPEs/"+file_name, 'rb') as f:
-                            tape.extend(f.read(-1))
-                            
-                # Process headers.
-                if line[0] == "H":      
-                    
-                    # Add leading nulls plus nulls terminator.
-                    for i in range(0,30):
-                        tape.append(0x00)
-                    tape.append(0x01)
-                          
-                    # Parse out the command line arguments.
-                    tokens = line.split()
-                    name = tokens[1]
-                    program_type = int(tokens[2], 16)
-                    data_size = tokens[3]
-                    start_address = tokens[4]
-                    exec_address = tokens[5]
-                    self.emit_header(tape, name, program_type, data_size, start_address, exec_address)
+                # Data is assumed to be in hex pairs.
+                data = line.split( )[1]
+                                        
+                # Emit the data.
+                for i in range(0, len(data), 2):
+                    data_bytes.append(int(data[i]+data[i+1], 16))
                     
-                # Process data lines.
-                if line[0] == "D":
+                # Set the processing data flag.
+                processing_data = True  
+                
+        # Write out the data to the virtual tape.
+        if processing_data:
+            self.write_data_with_crc(tape, data_bytes)
                     
-                    # Data is assumed to be in hex pairs.
-                    data = line.split( )[1]
-                                            
-                    # Emit the data.
-                    for i in range(0, len(data), 2):
-                        data_bytes.append(int(data[i]+data[i+1], 16))
-                        
-                    # Set the processing data flag.
-                    processing_data = True  
+    def load_virtual_tape(self, f, tape, directory="TAPEs"):
+        for entry in self.read_tape_entries(f):
+            self.encode_tape_entry(entry, tape, directory)
                     
+    def open_saved_program(self):
+        # Have to find the file name. Skip the leader, then the name ends with a null.
+        start = next((i for i, b in enumerate(self.virtual_tape_out) if b >= 2), None)
+        if start is None:
+            return
+        self.save_file_name = self.virtual_tape_out[start:-1].decode('latin1') + ".TAP"
+        
+        # Stream the "program" out as a hex file from here on.
+        # Saved programs go next to the tape they are added to.
+        self.save_path = os.path.join(self.current_tape.directory, self.save_file_name.lower())
+        self.save_file = open(self.save_path, 'wb')
+        self.save_file.write(self.virtual_tape_out)
+        self.virtual_tape_out.clear()
+        
     def write_saved_program(self):
-        # Have to find the file name.
-        for i in range(0, len(self.virtual_tape_out)):
-            # Skip the leader.
-            if self.virtual_tape_out[i] < 2:
-                continue
+        self.save_file.close()
+        self.save_file = None
         
-            # Should be at the first letter of the name.
-            file_name = ""
-            while self.virtual_tape_out[i] > 0:
-                file_name = file_name + chr(self.virtual_tape_out[i])
-                i += 1
-            break
-        
-        # Now write the "program" out as a hex file.
-        file_name = file_name + ".HEX"
-        with open("TAPEs/"+file_name, 'wb') as f:
-            f.write(self.virtual_tape_out)
-            f.close()
-        
-        # See if there is an entry in the TAPE file and add one if there isn't.
-        if self.current_tape == self.virtual_tape_1:
-            tape_name = "TAPEs/TAPE1.svt"
-        else:
-            tape_name = "TAPEs/TAPE2.svt"
-        with open(tape_name, 'r+') as f:
-            # See if the filename is already there.
-            has_file_name = False
-            for line in f:
-                if file_name in line.upper():
-                    has_file_name = True
-                    break
-            f.close()
-            if not has_file_name:
-                with open(tape_name, 'a') as f:
-                    f.write("\n")
-                    f.write("F " + file_name)
-                    f.close()
-        
-        # Reload the current virtual tape.      
-        self.current_tape.clear()
-        try:
-            with open(tape_name, 'r') as f:
-                self.load_virtual_tape(f, self.current_tape)
-        except FileNotFoundError:
-            print("Problem updating virtual tape.")
+        # Record it as audio too.
+        if self.save_audio_baud:
+            import kcs
+            with open(self.save_path, 'rb') as f:
+                kcs.encode(f.read(), self.save_path[:-4] + ".wav", self.save_audio_baud)
+        
+        # Add the program to the current virtual tape.
+        self.current_tape.add_file(self, self.save_file_name)
             
     def key_pressed(self, channel):
         key = 0
@@ -304,7 +299,10 @@ class IO:
                 LOCAL_MODE = False
             else:
                 LOCAL_MODE = True
-                self.prompt_file()
+                # This runs on a GPIO thread, so leave the dialog to the main loop.
+                self.prompt_requested = True
+                if self.input_listener:
+                    self.input_listener()
             
             
     # Get the name of a file to load.
@@ -313,42 +311,55 @@ class IO:
         top = tkinter.Tk()
         top.withdraw()  # hide window
         file_name = tkinter.filedialog.askopenfilename(parent=top,  title='Open an input file:')
-        if file_name:
-            with open(file_name, 'rb') as f:
-                file_bytes = f.read()
-                self.file_input(file_bytes)
         top.destroy()
+        if file_name:
+            self.paste_file(file_name)
      
     def __init__(self):
         
-        global ser
+        # Keys from the virtual and physical keyboards, filled from any thread.
+        self.keys = keyqueue.KeyQueue()
         
-        # Used for virtual keyboard.      
-        self.key_buffer = bytearray(10)
-        self.next_key = 0
-        self.add_key = 0
-        self.num_keys = 0
+        # Set when the Local key asks for a file to paste, for the main loop to open the dialog.
+        self.prompt_requested = False
         
         # Used when accepting input from a file.
-        self.file_buffer = None
-        self.next_char = 0
-        self.num_chars = 0
+        self.paste = None
+        self.paste_pacing = paste.PROMPT
+        
+        # Memory with the display, set by the emulator so pastes can be paced by the echo.
+        self.display_memory = None
+        
+        # Called with no arguments when input arrives, possibly from another thread.
+        self.input_listener = None
         
         # Used by virtual display to control scrolling.
         self.start_display_line = 0
         
-        # Load the data here for the virtual tape drives.
-        self.virtual_tape_1 = bytearray()
-        self.virtual_tape_2 = bytearray()
+        # The virtual tape drives. Each is loaded the first time it is turned on.
+        self.virtual_tape_1 = virtualtape.VirtualTape(1, virtualtape.tape_path("TAPEs/TAPE1"))
+        self.virtual_tape_2 = virtualtape.VirtualTape(2, virtualtape.tape_path("TAPEs/TAPE2"))
         self.current_tape = self.virtual_tape_1
         
-        # Store save data here before writing to disk.
+        # Store save data here until the name has been written, then in the save file.
         self.virtual_tape_out = bytearray()
+        self.save_file = None
+        self.save_file_name = None
+        self.save_path = None
+        
+        # When set, saved programs are also written as KCS or CUTS audio at this speed.
+        self.save_audio_baud = None
         self.tape_on = False
         
         # Points to the current position on the tapes.
         self.tape_head = 0
         
+        # Serial line, when there is one.
+        self.serial = None
+        
+        # Printer on the parallel port, when there is one.
+        self.printer = None
+        
         # Serial port settings.
         self.baud = 9600
         self.bytesize = serial.EIGHTBITS
@@ -358,18 +369,13 @@ class IO:
         # Sense switch.
         self.sense_switch = 0xFF
         
-        # Load the virtual cassette tapes.
-        try:
-            with open("TAPEs/TAPE1.svt", 'r') as f:
-                self.load_virtual_tape(f, self.virtual_tape_1)
-        except FileNotFoundError:
-            print("There is no virtual cassette tape 1.")
-        
-        try:
-            with open("TAPEs/TAPE2.svt", 'r') as f:
-                self.load_virtual_tape(f, self.virtual_tape_2)
-        except FileNotFoundError:
-            print("There is no virtual cassette tape 2.")
+        # Handlers for IN and OUT on each port. Reads of unmapped ports return 0, and accesses to them are counted
+        # by port.
+        self.input_handlers = [self._unmapped_input] * 256
+        self.output_handlers = [self._unmapped_output] * 256
+        self.unmapped_inputs = {}
+        self.unmapped_outputs = {}
+        self._register_devices()
         
         # Setup physical keyboard handler.
         if HAS_KEYBOARD:
@@ -390,118 +396,249 @@ class IO:
             GPIO.add_event_detect(self.KB_RESET, GPIO.FALLING, callback=self.reset_pressed)
             GPIO.add_event_detect(self.KB_BREAK, GPIO.RISING, callback=self.break_pressed)
             GPIO.add_event_detect(self.KB_LOCAL, GPIO.BOTH, callback=self.local_pressed)
-            
-        # Create a serial port handler.
+        
+    def insert_tape(self, number, path):
+        """
+        Put another virtual tape file in tape drive 1 or 2. It is read the next time the drive is turned on.
+        """
+        tape = virtualtape.VirtualTape(number, path)
+        if number == 1:
+            self.virtual_tape_1 = tape
+        else:
+            self.virtual_tape_2 = tape
+        self.current_tape = self.virtual_tape_1
+        self.tape_head = 0
+        
+    def open_serial(self, device=SERIAL_DEVICE, paced=True):
+        """
+        Open a serial line with the current settings, in place of any serial line already open.
+        
+        :param device: host serial port or pyserial URL, 'pty' for a pseudo-terminal or 'tcp:PORT' for a localhost
+            TCP listener
+        :param paced: run a pseudo-terminal or TCP line at the baud rate rather than flat out
+        """
+        self.close_serial()
         try:
-            # Open serial port. Defaults to 9600 8N1 with no flow control. 
-            ser = serial.Serial('/dev/ttyUSB0',baudrate=self.baud, bytesize=self.bytesize, parity=self.parity, stopbits=self.stopbits)  
-        except:
-            print("Serial port not found.")
-        
-    def buffer_key(self, key):
-        if (self.num_keys < 10):
-            self.key_buffer[self.add_key] = key
-            self.add_key = (self.add_key + 1) % 10
-            self.num_keys = self.num_keys + 1
+            # Defaults to 9600 8N1 with no flow control.
+            self.serial = serialport.open_line(device, baudrate=self.baud, bytesize=self.bytesize, parity=self.parity,
+                                               stopbits=self.stopbits, paced=paced)
+        except (OSError, ValueError, serial.SerialException) as e:
+            print("Serial port not found. " + str(e))
+            return
+        name = getattr(self.serial, 'name', None)
+        if name:
+            print("Serial port on " + name + ".")
+            
+    def close_serial(self):
+        if self.serial:
+            self.serial.close()
+            self.serial = None
+            
+    def open_printer(self, path, rate=None):
+        """
+        Capture parallel port output to a file, in place of any printer already attached.
+        
+        :param path: file to append to, '-' for stdout, or a binary file to write to
+        :param rate: characters per second the printer takes, or None for no limit
+        """
+        self.close_printer()
+        self.printer = printer.ParallelPrinter(path, rate)
+        
+    def poll_printer(self):
+        """
+        Write out printer output that has waited long enough. Called once a slice.
+        """
+        if self.printer:
+            self.printer.poll()
             
-    def file_input(self, buffer):
-        self.file_buffer = bytearray(buffer)
-        self.file_buffer.append(10) # Make sure there is a Line Feed at the end.
-        self.next_char = 0
-        self.num_chars = len(self.file_buffer)
+    def close_printer(self):
+        if self.printer:
+            self.printer.close()
+            self.printer = None
+            
+    def buffer_key(self, key, timestamp=None):
+        """
+        Queue a key for the keyboard port. Safe to call from any thread.
+        
+        :param timestamp: perf_counter time of the key press, if it was earlier than now
+        """
+        self.keys.put(key, timestamp)
+        if self.input_listener:
+            self.input_listener()
+            
+    def file_input(self, source):
+        """
+        Type in a file, or bytes, through the keyboard port, paced by paste_pacing.
+        """
+        if self.paste:
+            self.paste.close()
+        self.paste = paste.PasteInput(source, self.paste_pacing, memory=self.display_memory)
+        if self.input_listener:
+            self.input_listener()
+            
+    def paste_file(self, file_name):
+        try:
+            self.file_input(file_name)
+        except OSError as e:
+            print(e)
             
     def get_input(self):
         key = 0
-        if self.next_char < self.num_chars:
-            key = self.file_buffer[self.next_char]
-            if key == 13: key = 10   # Ignore Carriage Returns
-            self.next_char += 1
-            if self.next_char == self.num_chars:
-                self.file_buffer = None
-                self.next_char = 0
-                self.num_chars = 0
+        if self.paste and self.paste.ready():
+            key = self.paste.read()
+            if self.paste.done:
+                self.paste = None
             
-        elif self.num_keys > 0:
-            key = self.key_buffer[self.next_key]
-            self.num_keys -= 1
-            self.next_key = (self.next_key + 1) % 10
+        elif len(self.keys) > 0:
+            key = self.keys.get()
         return key
 
+    def register_input(self, port, handler):
+        """
+        Route IN instructions for a port to a handler, called with the port and returning the byte read.
+        """
+        self.input_handlers[port] = handler
+        
+    def register_output(self, port, handler):
+        """
+        Route OUT instructions for a port to a handler, called with the port and the byte written.
+        """
+        self.output_handlers[port] = handler
+        
+    def _register_devices(self):
+        # Sense switches.
+        self.register_input(0xFF, self._input_sense_switch)
+        
+        # Keyboard and tape status, keyboard data.
+        self.register_input(0xFA, self._input_status)
+        self.register_input(0xFC, self._input_keyboard)
+        
+        # Tape.
+        self.register_output(0xFA, self._output_tape_control)
+        self.register_input(0xFB, self._input_tape)
+        self.register_output(0xFB, self._output_tape)
+        
+        # Parallel port output. Without a printer the bytes are dropped.
+        self.register_output(0xFD, self._output_parallel)
+        
+        # Display scrolling.
+        self.register_input(0xFE, self._input_display_status)
+        self.register_output(0xFE, self._output_display_scroll)
+        
+        # Serial port. Writes to the status port do nothing on the Sol, so they are counted as unmapped.
+        self.register_input(0xF8, self._input_serial_status)
+        self.register_input(0xF9, self._input_serial)
+        self.register_output(0xF9, self._output_serial)
+        
     def output(self, port, value):
-        global ser
-        if port == 0xFE:
-            # Display scrolling control.
-            self.start_display_line = value
-        elif port == 0xFA:
-            if value == self.TT1:
-                # Turn on the tape.
-                self.tape_head = 0
-                self.current_tape = self.virtual_tape_1
-                self.virtual_tape_out.clear()
-                self.tape_on = True
-                
-            elif value == self.TT2:
-                # Turn on the tape.
-                self.tape_head = 0
-                self.current_tape = self.virtual_tape_2
-                self.virtual_tape_out.clear()
-                self.tape_on = True
-            else:
-                # Turn the tape off.
-                if self.tape_on and len(self.virtual_tape_out) > 0:
-                    self.write_saved_program()
-                self.tape_on = False
-                
-        elif port == 0xFB:
-            # Write the byte to the virtual tape out.
-            self.virtual_tape_out.append(value)
-        elif port == 0xF8:
-            print("control" + hex(value))
-        elif port == 0xF9:
-            if ser:
-                # Write a byte to the serial( port.
-                ser.write(value)
-        else:
-            print("O:", hex(port), hex(value))
+        self.output_handlers[port](port, value)
 
     def input(self, port):
-        global ser
-        result = 0
-        if port == 0xFF:
-            result = self.sense_switch
-        elif port == 0xFA:
-            is_key = self.KDR
-            if self.num_keys > 0 or self.next_char < self.num_chars:
-                is_key = 0
-            is_tape = 0
-            if self.tape_head < len(self.current_tape):
-                is_tape = is_tape | self.TDR | self.TTBE
-            result = is_key | is_tape
-        elif port == 0xFB:
-            result = self.current_tape[self.tape_head]
-            self.tape_head = self.tape_head + 1   
-        elif port == 0xFC:
-            result = self.get_input()
-        elif port == 0xFE:
-            result = self.SOK
-        elif port == 0xF8:
-            result = 0
-            # Only applies if serial port active.
-            if ser:
-                # Assume that the Serial port buffer can handle the output.
-                result = self.SDROT
-                # Check for serial input.
-                if ser.in_waiting() > 0:
-                    result = result | self.SDR
-        elif port == 0xF9:
-            result = 0
-            if ser:
-                result = ser.read(1)[0]
-        else:
-            print("I:", hex(port))
+        result = self.input_handlers[port](port)
     
         if result > 255:
             raise IOException('Invalid result={}'.format(result))
 
         return result
     
+    def _unmapped_input(self, port):
+        self.unmapped_inputs[port] = self.unmapped_inputs.get(port, 0) + 1
+        return 0
+    
+    def _unmapped_output(self, port, value):
+        self.unmapped_outputs[port] = self.unmapped_outputs.get(port, 0) + 1
+        
+    def _output_display_scroll(self, port, value):
+        # Display scrolling control.
+        self.start_display_line = value
+        
+    def _output_tape_control(self, port, value):
+        if (value == self.TT1 or value == self.TT2) and self.save_file:
+            # Turned on again without turning off first.
+            self.write_saved_program()
+        if value == self.TT1:
+            # Turn on the tape.
+            self.tape_head = 0
+            self.current_tape = self.virtual_tape_1
+            self.current_tape.mount(self)
+            self.virtual_tape_out.clear()
+            self.tape_on = True
+            
+        elif value == self.TT2:
+            # Turn on the tape.
+            self.tape_head = 0
+            self.current_tape = self.virtual_tape_2
+            self.current_tape.mount(self)
+            self.virtual_tape_out.clear()
+            self.tape_on = True
+        else:
+            # Turn the tape off.
+            if self.tape_on and self.save_file:
+                self.write_saved_program()
+            self.tape_on = False
+            
+    def _output_tape(self, port, value):
+        # Write the byte to the save file, or hold it until the name is known.
+        if self.save_file:
+            self.save_file.write(bytes((value,)))
+        else:
+            self.virtual_tape_out.append(value)
+            if value == 0:
+                self.open_saved_program()
+                
+    def _output_serial(self, port, value):
+        if self.paste:
+            self.paste.echo(value)
+        if self.serial:
+            # Queue a byte for the serial line's writer.
+            self.serial.write_byte(value)
+
+    def _input_sense_switch(self, port):
+        return self.sense_switch
+    
+    def _input_status(self, port):
+        # Polled constantly while waiting for a key or the tape, so keep it short. The keyboard and parallel bits
+        # are active low. There is never parallel input.
+        status = self.KDR | self.PDR
+        if len(self.keys) > 0 or (self.paste and self.paste.poll()):
+            status = self.PDR
+        if self.printer and not self.printer.ready():
+            status = status | self.PXDR
+        if self.tape_head < len(self.current_tape):
+            return status | self.TDR | self.TTBE
+        return status
+    
+    def _output_parallel(self, port, value):
+        if self.printer:
+            self.printer.write(value)
+        
+    def _input_tape(self, port):
+        # Past the end of the tape there is nothing to read.
+        if self.tape_head >= len(self.current_tape):
+            return 0
+        result = self.current_tape[self.tape_head]
+        self.tape_head = self.tape_head + 1   
+        return result
+    
+    def _input_keyboard(self, port):
+        return self.get_input()
+    
+    def _input_display_status(self, port):
+        return self.SOK
+    
+    def _input_serial_status(self, port):
+        result = 0
+        # Only applies if a serial line is open. Answered from its buffers.
+        serial_line = self.serial
+        if serial_line:
+            if serial_line.can_write():
+                result = self.SDROT
+            if serial_line.waiting() > 0:
+                result = result | self.SDR
+        return result
+    
+    def _input_serial(self, port):
+        if self.serial:
+            return self.serial.read_byte()
+        return 0
+    
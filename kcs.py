@@ -0,0 +1,228 @@
+"""
+Kansas City Standard and CUTS cassette audio codec.
+
+At 300 baud a 0 bit is 4 cycles of 1200 Hz and a 1 bit 8 cycles of 2400 Hz. At 1200 baud (CUTS) a 0 bit is half a
+cycle of 600 Hz and a 1 bit one cycle of 1200 Hz. Each byte is a 0 start bit, 8 data bits with the lowest first
+and one or more 1 stop bits. The decoded bytes are what SOLOS reads from port FB.
+
+    python kcs.py decode tape.wav tape.hex [--baud 300|1200]
+    python kcs.py encode tape.hex tape.wav [--baud 300|1200]
+"""
+import wave
+from argparse import ArgumentParser
+
+import numpy as np
+
+# Mark (1) and space (0) frequencies for each speed.
+SPEEDS = {300: (2400, 1200), 1200: (1200, 600)}
+
+HIGHEST_HZ = max(max(speed) for speed in SPEEDS.values())
+
+# Level the signal has to pass to change sign, as a fraction of its standard deviation.
+HYSTERESIS = 0.3
+
+# Frames read from a WAV file at a time.
+CHUNK_FRAMES = 1 << 20
+
+# Bytes encoded at a time.
+CHUNK_BYTES = 4096
+
+
+class KCSException(Exception):
+    pass
+
+
+def _samples(data, width, channels):
+    """
+    Convert WAV frames to signed samples of the first channel.
+    """
+    if width == 1:
+        samples = np.frombuffer(data, np.uint8).astype(np.int16) - 128
+    elif width == 2:
+        samples = np.frombuffer(data, '<i2')
+    elif width == 3:
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = (raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8
+    elif width == 4:
+        samples = np.frombuffer(data, '<i4')
+    else:
+        raise KCSException('Unsupported sample width {}'.format(width))
+    return samples[::channels]
+
+
+def _schmitt(samples, hysteresis, previous):
+    """
+    The sign of the signal, only changing once it passes the hysteresis level, so noise around zero is ignored.
+    """
+    above = samples > hysteresis
+    defined = above | (samples < -hysteresis)
+    last = np.maximum.accumulate(np.where(defined, np.arange(len(samples)), -1))
+    positive = above[np.maximum(last, 0)]
+    positive[last < 0] = bool(previous) if previous is not None else False
+    return positive
+
+
+def zero_crossings(path):
+    """
+    Find where the signal crosses zero, reading the file a chunk at a time.
+
+    :return: (sample rate, array of the sample positions where the sign changes)
+    """
+    parts = []
+    with wave.open(path, 'rb') as f:
+        rate = f.getframerate()
+        width = f.getsampwidth()
+        channels = f.getnchannels()
+        offset = 0
+        previous = None
+        while True:
+            data = f.readframes(CHUNK_FRAMES)
+            if len(data) == 0:
+                break
+            samples = _samples(data, width, channels).astype(np.float32)
+            # Taking off the mean of each chunk removes any DC offset and slow drift.
+            samples -= samples.mean()
+            # A moving average over a quarter cycle of the highest tone takes off most of the noise above it.
+            taps = max(1, rate // (4 * HIGHEST_HZ))
+            samples = np.convolve(samples, np.ones(taps, np.float32) / taps, 'same')
+            positive = _schmitt(samples, HYSTERESIS * samples.std(), previous)
+            if previous is None:
+                previous = positive[0]
+            changes = np.flatnonzero(np.concatenate(([previous], positive[:-1])) != positive)
+            parts.append(changes + offset)
+            previous = positive[-1]
+            offset += len(samples)
+    return rate, np.concatenate(parts) if parts else np.zeros(0, np.int64)
+
+
+def detect_baud(half_periods, rate):
+    """
+    Only 300 baud recordings have 2400 Hz tones and only 1200 baud ones have 600 Hz tones.
+    """
+    def near(hz):
+        half_period = rate / (2 * hz)
+        return np.count_nonzero(np.abs(half_periods - half_period) < half_period / 4)
+    return 300 if near(2400) >= near(600) else 1200
+
+
+def demodulate(crossings, rate, baud=None):
+    """
+    Turn zero crossings into bytes.
+
+    Each half cycle is a mark or a space by its length. Every mark to space change is a possible start bit, and
+    the 10 bits of each are read at once as the share of mark in the middle half of each bit time. A single pass
+    then picks the start bits that follow on from the previous byte.
+
+    :param baud: 300, 1200 or None to detect it
+    :return: bytearray
+    """
+    if len(crossings) < 2:
+        return bytearray()
+    starts = crossings[:-1]
+    half_periods = np.diff(crossings)
+    if baud is None:
+        baud = detect_baud(half_periods, rate)
+    if baud not in SPEEDS:
+        raise KCSException('Unsupported speed {} baud'.format(baud))
+    mark_hz, space_hz = SPEEDS[baud]
+    threshold = (rate / (2 * mark_hz) + rate / (2 * space_hz)) / 2
+    is_mark = half_periods < threshold
+
+    # Samples of mark before each half cycle.
+    mark_before = np.concatenate(([0], np.cumsum(np.where(is_mark, half_periods, 0))))
+
+    def marks_to(t):
+        k = np.clip(np.searchsorted(starts, t, 'right') - 1, 0, len(starts) - 1)
+        return mark_before[k] + np.clip(t - starts[k], 0, half_periods[k]) * is_mark[k]
+
+    bit_time = rate / baud
+    falling = starts[1:][is_mark[:-1] & ~is_mark[1:]]
+    centres = falling[:, None] + (np.arange(10) + 0.5) * bit_time
+    low = centres - bit_time / 4
+    high = centres + bit_time / 4
+    bits = (marks_to(high) - marks_to(low)) * 2 > high - low
+    valid = ~bits[:, 0] & bits[:, 9]
+    values = bits[:, 1:9].astype(np.int32) @ (1 << np.arange(8))
+    ends = falling + 9.5 * bit_time
+
+    data = bytearray()
+    position = -1
+    for start, ok, value, end in zip(falling.tolist(), valid.tolist(), values.tolist(), ends.tolist()):
+        if ok and start >= position:
+            data.append(value)
+            position = end
+    return data
+
+
+def decode(path, baud=None):
+    """
+    Decode a WAV recording of a cassette.
+
+    :return: bytearray of the bytes on the tape
+    """
+    rate, crossings = zero_crossings(path)
+    return demodulate(crossings, rate, baud)
+
+
+def encode(data, path, baud=300, rate=48000, stop_bits=2, lead_in=0.5):
+    """
+    Write bytes as a 16 bit mono WAV recording, with lead_in seconds of mark tone before and after.
+    """
+    if baud not in SPEEDS:
+        raise KCSException('Unsupported speed {} baud'.format(baud))
+    mark_hz, space_hz = SPEEDS[baud]
+    lead = np.ones(int(lead_in * baud), bool)
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        sample = 0
+        bit_count = 0
+        phase = 0.0
+        chunks = [data[i:i + CHUNK_BYTES] for i in range(0, len(data), CHUNK_BYTES)]
+        for chunk in [None] + chunks + [None]:
+            if chunk is None:
+                bits = lead
+            else:
+                values = np.frombuffer(bytes(chunk), np.uint8)
+                frames = np.hstack((np.zeros((len(values), 1), bool),
+                                    (values[:, None] >> np.arange(8) & 1).astype(bool),
+                                    np.ones((len(values), stop_bits), bool)))
+                bits = frames.ravel()
+
+            # The phase at the start of each bit is worked out per bit rather than per sample, so the tone stays
+            # continuous and in step with the bits at any sample rate.
+            frequencies = np.where(bits, mark_hz, space_hz)
+            bit_phases = phase + 2 * np.pi * np.concatenate(([0], np.cumsum(frequencies))) / baud
+            end = (bit_count + len(bits)) * rate // baud
+            samples = np.arange(sample, end)
+            bit_index = np.minimum(samples * baud // rate - bit_count, len(bits) - 1)
+            phases = bit_phases[bit_index] + 2 * np.pi * frequencies[bit_index] * (
+                samples / rate - (bit_count + bit_index) / baud)
+            f.writeframes((np.sin(phases) * 24000).astype('<i2').tobytes())
+            phase = bit_phases[-1] % (2 * np.pi)
+            sample = end
+            bit_count += len(bits)
+
+
+def main():
+    arg_parser = ArgumentParser(description='Convert between Sol-20 tape bytes and KCS or CUTS audio')
+    arg_parser.add_argument('command', choices=('decode', 'encode'))
+    arg_parser.add_argument('input')
+    arg_parser.add_argument('output')
+    arg_parser.add_argument('--baud', type=int, choices=sorted(SPEEDS), help='Tape speed, detected when decoding')
+    arg_parser.add_argument('--rate', type=int, default=48000, help='Sample rate when encoding')
+    args = arg_parser.parse_args()
+
+    if args.command == 'decode':
+        data = decode(args.input, args.baud)
+        with open(args.output, 'wb') as f:
+            f.write(data)
+    else:
+        with open(args.input, 'rb') as f:
+            data = f.read()
+        encode(data, args.output, args.baud or 300, args.rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+
+
+class KeyQueue:
+    """
+    Keys waiting to be read from the keyboard port.
+
+    Any number of producers, such as the GPIO keyboard callbacks, the pygame event loop or a serial reader, call put
+    from their own threads. Only the CPU thread calls get. Appending to and popping from a deque are atomic, so
+    neither side takes a lock. The lock is only taken to count a dropped key. Producers racing for the last free
+    place can take the queue a key or two over its capacity, which does no harm.
+    """
+
+    def __init__(self, capacity=256):
+        """
+        :param capacity: keys held before new ones are dropped
+        """
+        self.capacity = capacity
+        self._keys = deque()
+        self._drop_lock = threading.Lock()
+
+        # Metrics. Only the CPU thread updates the delivery counts.
+        self.dropped = 0
+        self.delivered = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        # When the key last taken by get was queued, for measuring how long its echo takes.
+        self.last_time = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def put(self, key, timestamp=None):
+        """
+        Add a key, from any thread.
+
+        :param timestamp: perf_counter time of the key press, if it was earlier than now
+        :return: False if the queue was full and the key was dropped
+        """
+        if len(self._keys) >= self.capacity:
+            with self._drop_lock:
+                self.dropped += 1
+            return False
+        self._keys.append((key, timestamp if timestamp is not None else time.perf_counter()))
+        return True
+
+    def get(self):
+        """
+        Take the oldest key, from the CPU thread.
+
+        :return: the key, or None if there isn't one
+        """
+        try:
+            key, queued = self._keys.popleft()
+        except IndexError:
+            return None
+        latency = time.perf_counter() - queued
+        self.last_time = queued
+        self.delivered += 1
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+        return key
+
+    def clear(self):
+        self._keys.clear()
+
+    def metrics(self):
+        """
+        :return: dict of the keys delivered, dropped and waiting, and the mean and worst time in seconds from a key
+            being queued to the CPU reading it
+        """
+        return {
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'waiting': len(self._keys),
+            'mean_latency': self.total_latency / self.delivered if self.delivered else 0.0,
+            'max_latency': self.max_latency,
+        }
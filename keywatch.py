@@ -0,0 +1,117 @@
+import time
+
+from cpu import EndSlice
+
+KEYBOARD_STATUS_PORT = 0xFA
+KEYBOARD_DATA_PORT = 0xFC
+
+# Video memory. Only writes here count as the echo of a key.
+TEXT_ADDRESS = 0xCC00
+TEXT_END = TEXT_ADDRESS + 1024
+
+
+class KeyWatcher:
+    """
+    Ends CPU slices early around key presses, so keys reach the program and their echo reaches the screen without
+    waiting for the rest of a slice.
+
+    While the program polls the keyboard status, pending key events are checked for every poll_interval seconds,
+    and if there is one the slice ends so the run loop can pick it up. Once a key has been read and the program has
+    written to the display, the slice ends at the next IN, so the echo is drawn straight away. The time from a key
+    event to that first display write is kept as the echo latency.
+
+    A slice only ends on an IN instruction, with the PC rewound to run it again, before any other input handler sees
+    it.
+    """
+
+    def __init__(self, cpu, poll_events=None, poll_interval=0.001):
+        """
+        :param poll_events: called with no arguments, True if a key event is waiting for the run loop
+        :param poll_interval: seconds between calls to poll_events
+        """
+        self._cpu = cpu
+        self._io = cpu.io
+        self.poll_events = poll_events
+        self.poll_interval = poll_interval
+        self._next_poll = 0.0
+
+        # When a key event waiting for the run loop was first seen.
+        self._event_time = None
+
+        # When the key just read was pressed, until the program writes to the display.
+        self._echo_pending = None
+        self._end_slice = False
+
+        # Metrics.
+        self.echoes = 0
+        self.total_echo_latency = 0.0
+        self.max_echo_latency = 0.0
+        self.early_slices = 0
+
+        self._input = self._io.input
+        self._io.input = self.input
+        self._check_memory_changed = cpu.check_memory_changed
+        cpu.check_memory_changed = self.check_memory_changed
+
+    def input(self, port):
+        if self._end_slice:
+            self._end_slice = False
+            self._rewind()
+        if port == KEYBOARD_STATUS_PORT and self.poll_events:
+            now = time.perf_counter()
+            if now >= self._next_poll:
+                self._next_poll = now + self.poll_interval
+                if self.poll_events():
+                    if self._event_time is None:
+                        self._event_time = now
+                    self._rewind()
+        value = self._input(port)
+        if port == KEYBOARD_DATA_PORT and self._io.keys.last_time is not None:
+            self._echo_pending = self._io.keys.last_time
+            self._io.keys.last_time = None
+        return value
+
+    def _rewind(self):
+        self.early_slices += 1
+        self._cpu._pc = (self._cpu._pc - 2) & 0xFFFF
+        raise EndSlice()
+
+    def check_memory_changed(self, address):
+        self._check_memory_changed(address)
+        if self._echo_pending is not None and TEXT_ADDRESS <= address < TEXT_END:
+            latency = time.perf_counter() - self._echo_pending
+            self._echo_pending = None
+            self.echoes += 1
+            self.total_echo_latency += latency
+            if latency > self.max_echo_latency:
+                self.max_echo_latency = latency
+            self._end_slice = True
+
+    def event_time(self):
+        """
+        Take the time the run loop's pending key event was first seen during a slice.
+
+        :return: perf_counter time, or None if it was not seen
+        """
+        event_time = self._event_time
+        self._event_time = None
+        return event_time
+
+    def metrics(self):
+        """
+        :return: dict of the number of keys echoed, the mean and worst seconds from key event to echo and the slices
+            ended early
+        """
+        return {
+            'echoes': self.echoes,
+            'mean_echo_latency': self.total_echo_latency / self.echoes if self.echoes else 0.0,
+            'max_echo_latency': self.max_echo_latency,
+            'early_slices': self.early_slices,
+        }
+
+    def close(self):
+        """
+        Restores the original input handler and memory watch.
+        """
+        self._io.input = self._input
+        self._cpu.check_memory_changed = self._check_memory_changed
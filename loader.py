@@ -0,0 +1,240 @@
+"""
+Load programs straight into memory from ENT, Intel HEX (.ihx) and raw binary files, and convert between them:
+
+    python loader.py chess.ent chess.ihx
+    python loader.py chess.ihx chess.bin
+"""
+import os
+from argparse import ArgumentParser
+
+ROM_ADDRESS = 0xC000
+ROM_END = 0xC7FF
+
+# Intel HEX record types.
+DATA_RECORD = 0
+END_RECORD = 1
+START_SEGMENT_RECORD = 3
+START_LINEAR_RECORD = 5
+
+# Data bytes per Intel HEX record written.
+RECORD_SIZE = 16
+
+INTEL_HEX_EXTENSIONS = ('.ihx', '.ihex')
+
+
+class LoaderException(Exception):
+    pass
+
+
+def write_memory(cpu, address, data):
+    """
+    Copy bytes into memory. The ROM stays untouched, and writes to the display are seen by the CPU's memory watch.
+    """
+    end = address + len(data)
+    if end <= ROM_ADDRESS:
+        cpu.memory[address:end] = data
+    else:
+        for i in range(len(data)):
+            cpu.write_byte((address + i) & 0xFFFF, data[i])
+
+
+def read_ent(path):
+    """
+    Parse a SOLOS ENTER file: an EN or ENTER line with the address, then lines of address: hex bytes, ending in /.
+
+    :return: (execution address, list of (address, bytearray) blocks of contiguous data)
+    """
+    start_address = None
+    blocks = []
+    address = 0
+    data = None
+    with open(path, 'r') as f:
+        for line in f:
+            line_address, colon, line_data = line.partition(":")
+            if not colon:
+                tokens = line.split()
+                if len(tokens) == 0:
+                    continue
+                if tokens[0].upper() in ("EN", "ENTER"):
+                    address = int(tokens[1], 16)
+                    if start_address is None:
+                        start_address = address
+                    data = None
+                    continue
+                # Data without an address carries on from the last line.
+                line_data = line
+                if data is None:
+                    data = bytearray()
+                    blocks.append((address, data))
+            else:
+                line_address = int(line_address, 16)
+                if data is None or line_address != address:
+                    data = bytearray()
+                    blocks.append((line_address, data))
+                    address = line_address
+            try:
+                line_bytes = bytes.fromhex(line_data.split('/', 1)[0])
+            except ValueError:
+                raise LoaderException('Bad data in {}: {}'.format(path, line.strip()))
+            data += line_bytes
+            address += len(line_bytes)
+    if start_address is None:
+        raise LoaderException('{} has no ENTER line'.format(path))
+    return start_address, blocks
+
+
+def load_ent(cpu, path):
+    """
+    Copy an ENTER file straight into memory, bypassing the virtual tape.
+
+    :return: execution address
+    """
+    start_address, blocks = read_ent(path)
+    for address, data in blocks:
+        write_memory(cpu, address, data)
+    return start_address
+
+
+def read_intel_hex(path):
+    """
+    Parse an Intel HEX file.
+
+    :return: (execution address from a start record, or the first data address, list of (address, bytearray) blocks)
+    """
+    start_address = None
+    blocks = []
+    data = None
+    address = 0
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                if line[0] != ':':
+                    raise ValueError()
+                record = bytes.fromhex(line[1:])
+                if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xFF != 0:
+                    raise ValueError()
+            except ValueError:
+                raise LoaderException('Bad record in {}: {}'.format(path, line))
+            record_type = record[3]
+            record_address = (record[1] << 8) + record[2]
+            if record_type == DATA_RECORD:
+                if data is None or record_address != address:
+                    data = bytearray()
+                    blocks.append((record_address, data))
+                data += record[4:-1]
+                address = record_address + record[0]
+            elif record_type == END_RECORD:
+                break
+            elif record_type in (START_SEGMENT_RECORD, START_LINEAR_RECORD):
+                start_address = int.from_bytes(record[4:-1], 'big') & 0xFFFF
+            elif any(record[4:-1]):
+                raise LoaderException('{} uses addresses above 64K'.format(path))
+    if start_address is None and len(blocks) > 0:
+        start_address = blocks[0][0]
+    return start_address, blocks
+
+
+def write_intel_hex(path, blocks, start_address=None):
+    """
+    Write (address, bytes) blocks as an Intel HEX file.
+    """
+    with open(path, 'w') as f:
+        for block_address, data in blocks:
+            for offset in range(0, len(data), RECORD_SIZE):
+                address = block_address + offset
+                chunk = data[offset:offset + RECORD_SIZE]
+                f.write(_intel_hex_record(address, DATA_RECORD, chunk))
+        if start_address is not None:
+            f.write(_intel_hex_record(0, START_LINEAR_RECORD, start_address.to_bytes(4, 'big')))
+        f.write(_intel_hex_record(0, END_RECORD, b''))
+
+
+def _intel_hex_record(address, record_type, data):
+    record = bytes((len(data), address >> 8 & 0xFF, address & 0xFF, record_type)) + bytes(data)
+    return ':{}{:02X}\n'.format(record.hex().upper(), -sum(record) & 0xFF)
+
+
+def read_bin(path, address):
+    """
+    Read a raw binary image that loads at an address.
+
+    :return: (address, list with the one (address, bytearray) block)
+    """
+    with open(path, 'rb') as f:
+        return address, [(address, bytearray(f.read()))]
+
+
+def write_bin(path, data):
+    """
+    Write a raw binary image. The load address is not kept.
+    """
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_program(path, address=None):
+    """
+    Read an ENT, Intel HEX or raw binary program, chosen by its extension.
+
+    :param address: load address of a raw binary image
+    :return: (execution address, list of (address, bytearray) blocks)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.ent':
+        return read_ent(path)
+    if extension in INTEL_HEX_EXTENSIONS:
+        return read_intel_hex(path)
+    if address is None:
+        raise LoaderException('{} needs a load address'.format(path))
+    return read_bin(path, address)
+
+
+def load_program(cpu, path, address=None):
+    """
+    Copy a program in any of the formats read_program reads straight into memory.
+
+    :return: execution address
+    """
+    start_address, blocks = read_program(path, address)
+    for block_address, data in blocks:
+        write_memory(cpu, block_address, data)
+    return start_address
+
+
+def image(blocks):
+    """
+    Join blocks into one contiguous image, with zeros in any gaps.
+
+    :return: (address, bytearray)
+    """
+    if len(blocks) == 0:
+        return 0, bytearray()
+    start = min(address for address, data in blocks)
+    end = max(address + len(data) for address, data in blocks)
+    data = bytearray(end - start)
+    for address, block in blocks:
+        data[address - start:address - start + len(block)] = block
+    return start, data
+
+
+def main():
+    arg_parser = ArgumentParser(description='Convert a program between ENT, Intel HEX and raw binary')
+    arg_parser.add_argument('input', help='.ent, .ihx or raw binary file')
+    arg_parser.add_argument('output', help='.ihx or raw binary file')
+    arg_parser.add_argument('--address', type=lambda a: int(a, 16), help='Load address of a raw binary input, in hex')
+    args = arg_parser.parse_args()
+
+    start_address, blocks = read_program(args.input, args.address)
+    if os.path.splitext(args.output)[1].lower() in INTEL_HEX_EXTENSIONS:
+        write_intel_hex(args.output, blocks, start_address)
+    else:
+        address, data = image(blocks)
+        write_bin(args.output, data)
+        print('Load address {:04X}, execution address {:04X}'.format(address, start_address))
+
+
+if __name__ == '__main__':
+    main()
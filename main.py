@@ -1,16 +1,126 @@
-from argparse import ArgumentParser
+import os
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
 
-from emulator import Emulator
+import paste
+from console import Console
+from idle import IdleDetector
+from io8080 import IO
+from recorder import InputRecorder, InputReplayer
+from tapetrap import TapeTrap, TapeTrapException
+
+
+def existing_file(path):
+    if not os.path.isfile(path):
+        raise ArgumentTypeError('there is no file {}'.format(path))
+    return path
 
 
 def main():
     arg_parser = ArgumentParser()
     arg_parser.add_argument('--filename', help='ROM file')
+    arg_parser.add_argument('--record', help='Record all port input to this file')
+    arg_parser.add_argument('--replay', help='Replay port input recorded with --record')
+    arg_parser.add_argument('--profile', help='Write a profile of the hottest code to this file on exit')
+    arg_parser.add_argument('--turbo', type=int, choices=(0, 1, 2, 4),
+                            help='Run at this multiple of the real 2.045 MHz clock, 0 for unlimited. F12 changes it. '
+                                 'The default is 1, or 0 with --console')
+    arg_parser.add_argument('--no-idle', action='store_true',
+                            help='Keep running the CPU flat out while it waits for input')
+    arg_parser.add_argument('--trace',
+                            help='Trace the last instructions executed to this file on Alt-T, on a CPU error and on '
+                                 'exit')
+    arg_parser.add_argument('--fast-tape', nargs='?', const='load', choices=('load', 'seek'),
+                            help='Load files from the virtual tapes instantly, or with seek just skip to the file')
+    arg_parser.add_argument('--load', help='ENT, Intel HEX (.ihx) or raw binary file to copy straight into memory. '
+                                           'Alt-E loads one while running')
+    arg_parser.add_argument('--load-address', type=lambda a: int(a, 16),
+                            help='Load address of a raw binary file, in hex')
+    arg_parser.add_argument('--run', action='store_true', help='Execute the --load file once SOLOS is at its prompt')
+    arg_parser.add_argument('--save-wav', type=int, choices=(300, 1200),
+                            help='Also write programs saved to tape as KCS (300) or CUTS (1200) baud WAV files')
+    arg_parser.add_argument('--key-buffer', type=int, default=256,
+                            help='Keys held while the program is busy before more are dropped')
+    arg_parser.add_argument('--paste', help='File to type in through the keyboard. Alt-L pastes one while running')
+    arg_parser.add_argument('--paste-pacing', choices=paste.PACINGS, default=paste.PROMPT,
+                            help='Send each pasted line once the program is back waiting for a key (prompt), once the '
+                                 'line end is echoed (echo) or as fast as it is read (none)')
+    arg_parser.add_argument('--serial', default=IO.SERIAL_DEVICE,
+                            help='Host serial port or pyserial URL for the serial port, "pty" for a pseudo-terminal, '
+                                 '"tcp:PORT" for a localhost TCP listener or "none" for no serial port')
+    arg_parser.add_argument('--serial-speed', choices=('baud', 'max'), default='baud',
+                            help='Run a pty or tcp serial line at the switches.cfg baud rate, or as fast as possible')
+    arg_parser.add_argument('--printer', help='Append parallel port output to this file, - for stdout')
+    arg_parser.add_argument('--printer-rate', type=int,
+                            help='Characters per second the printer takes, unlimited by default')
+    arg_parser.add_argument('--tape', type=existing_file, help='Virtual tape file for tape drive 1')
+    arg_parser.add_argument('--console', action='store_true',
+                            help='Run with no display, writing the screen text to stdout and typing stdin in')
+    arg_parser.add_argument('--curses', action='store_true',
+                            help='Show the screen in this text terminal instead of a window, for use over SSH')
     args = arg_parser.parse_args()
 
     filename = args.filename if args.filename else 'ROMs/solos.bin'
-    emu = Emulator(path=filename)
-    emu.run()
+    serial_device = None if args.serial == 'none' else args.serial
+    stdout = sys.stdout.buffer
+    if args.console:
+        # Only the screen text and the printer go to stdout. Messages go to stderr.
+        sys.stdout = sys.stderr
+        emu = Console(filename, stdout, serial_device=serial_device, serial_paced=args.serial_speed == 'baud')
+        turbo = args.turbo if args.turbo is not None else 0
+    elif args.curses:
+        from terminal import CursesTerminal
+        emu = CursesTerminal(filename, serial_device=serial_device, serial_paced=args.serial_speed == 'baud')
+        turbo = args.turbo if args.turbo is not None else 1
+    else:
+        from emulator import Emulator
+        emu = Emulator(path=filename, serial_device=serial_device, serial_paced=args.serial_speed == 'baud')
+        turbo = args.turbo if args.turbo is not None else 1
+    emu.set_turbo(turbo if turbo else None)
+    if args.tape:
+        emu.io.insert_tape(1, args.tape)
+
+    recorder = None
+    if args.record:
+        recorder = InputRecorder(emu.cpu, args.record)
+    elif args.replay:
+        recorder = InputReplayer(emu.cpu, args.replay)
+    elif not args.no_idle:
+        # Sleeping changes the cycle count, so it is off when recording or replaying.
+        emu.idle = IdleDetector(emu.cpu)
+    if args.fast_tape:
+        try:
+            TapeTrap(emu.cpu, seek_only=args.fast_tape == 'seek')
+        except TapeTrapException:
+            print("Fast tape loading is not available with this ROM.")
+    emu.io.save_audio_baud = args.save_wav
+    emu.io.keys.capacity = args.key_buffer
+    emu.io.paste_pacing = args.paste_pacing
+    if args.printer:
+        emu.io.open_printer(stdout if args.printer == '-' else args.printer, args.printer_rate)
+    if args.paste:
+        emu.io.paste_file(args.paste)
+    if args.load:
+        emu.load_program(args.load, args.run, args.load_address)
+    profiler = None
+    if args.profile:
+        profiler = emu.cpu.start_profiling()
+    if args.trace:
+        emu.tracer = emu.cpu.start_tracing(path=args.trace)
+    try:
+        emu.run()
+    finally:
+        if recorder:
+            recorder.close()
+        if profiler:
+            profiler.close()
+            with open(args.profile, 'w') as f:
+                f.write(profiler.report())
+        if emu.tracer:
+            emu.tracer.close()
+            emu.tracer.dump()
+        emu.io.close_serial()
+        emu.io.close_printer()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,98 @@
+from cpu import EndSlice
+from serialport import BufferedSerial
+
+# Instructions each machine runs before the next one gets a turn.
+QUANTUM = 1000
+
+
+class NullModemEnd(BufferedSerial):
+    """
+    One machine's end of a null-modem. A byte written here goes straight into the receive buffers of the other ends,
+    with no threads or host serial layer in between, so the line runs as fast as the machines do.
+    """
+
+    def __init__(self, modem, capacity):
+        super().__init__(capacity)
+        self._modem = modem
+
+    def can_write(self):
+        # Hold the sender off while a receiver is full, as hardware handshaking would.
+        for end in self._modem.ends:
+            if end is not self and len(end._received) >= end.capacity:
+                return False
+        return True
+
+    def write_byte(self, value):
+        for end in self._modem.ends:
+            if end is not self:
+                if len(end._received) >= end.capacity:
+                    end.receive_overflows += 1
+                else:
+                    end._received.append(value)
+                    end.bytes_received += 1
+        self.bytes_sent += 1
+
+    def _read(self):
+        # Bytes arrive in the receive buffer from the other ends, without a reader thread.
+        return b''
+
+    def _write(self, data):
+        for value in data:
+            self.write_byte(value)
+
+    def close(self):
+        self._closed = True
+        if self in self._modem.ends:
+            self._modem.ends.remove(self)
+
+
+class NullModem:
+    """
+    Links the serial ports of machines in the same process. With two machines it is a null-modem cable, and with
+    more each byte sent reaches all the others.
+
+    The machines can run on threads of their own or take turns on one thread with run_together.
+    """
+
+    def __init__(self, capacity=4096):
+        """
+        :param capacity: bytes each end holds before it drops what it receives
+        """
+        self.capacity = capacity
+        self.ends = []
+
+    def connect(self, io):
+        """
+        Plug a machine's serial port into the null-modem, in place of any serial line it had.
+
+        :return: NullModemEnd
+        """
+        io.close_serial()
+        end = NullModemEnd(self, self.capacity)
+        self.ends.append(end)
+        io.serial = end
+        return end
+
+
+def run_together(machines, quantum=QUANTUM, until=None, max_rounds=None):
+    """
+    Run several CPUs on this thread, each for quantum instructions in turn. A slice ended early just ends that
+    machine's turn.
+
+    :param until: called with no arguments after each round, True to stop
+    :param max_rounds: give up after this many rounds
+    :return: True if until stopped it, False if it ran out of rounds
+    """
+    rounds = 0
+    while until is None or not until():
+        if max_rounds is not None and rounds >= max_rounds:
+            return False
+        for machine in machines:
+            step = machine.step
+            try:
+                for _ in range(quantum):
+                    step()
+            except EndSlice:
+                pass
+        rounds += 1
+    return True
@@ -0,0 +1,167 @@
+import re
+from io import BytesIO
+
+# When the next line of a paste is sent.
+NONE = 'none'      # As fast as the program reads keys.
+PROMPT = 'prompt'  # Once the program is back polling for a key after the end of a line.
+ECHO = 'echo'      # Once the end of the line has been echoed to the display or the serial port.
+PACINGS = (NONE, PROMPT, ECHO)
+
+# Bytes read from the source at a time.
+CHUNK_SIZE = 4096
+
+DISPLAY_ADDRESS = 0xCC00
+DISPLAY_END = 0xD000
+DISPLAY_COLUMNS = 64
+
+# The cursor is the one character with the top bit set.
+CURSOR_PATTERN = re.compile(b'[\x80-\xFF]')
+
+
+def find_cursor(memory):
+    """
+    :return: address of the cursor on the display, or -1 if there isn't one
+    """
+    match = CURSOR_PATTERN.search(memory, DISPLAY_ADDRESS, DISPLAY_END)
+    return match.start() if match else -1
+
+
+class PasteInput:
+    """
+    Streams a file into the keyboard port, reading it from disk a chunk at a time so it can be any size. A
+    non-blocking file such as a pipe can be streamed too. Whatever has arrived is sent, and the paste is done once
+    the file ends.
+
+    Carriage returns are sent as line feeds and the paste always ends with a line feed. With PROMPT or ECHO pacing
+    the keyboard shows no key after each line until the program has finished with it, so nothing is lost while an
+    interpreter is busy with a line. Keys typed meanwhile still get through.
+    """
+
+    def __init__(self, source, pacing=PROMPT, polls=16, memory=None):
+        """
+        :param source: path of the file to paste, bytes, or a binary file object, which may be non-blocking
+        :param polls: keyboard status polls that count as being back at the prompt. Keep it below the idle
+            detector's repeats, or the host sleeps before the line is released
+        :param memory: memory with the display. With it PROMPT pacing only counts polls while the cursor stays put,
+            as programs check the keyboard while they print too, and ECHO pacing watches the cursor. Without it only
+            a CR on the serial port counts as an echo
+        """
+        if pacing not in PACINGS:
+            raise ValueError('Unknown pacing {}'.format(pacing))
+        if isinstance(source, str):
+            self._file = open(source, 'rb')
+        elif isinstance(source, (bytes, bytearray)):
+            self._file = BytesIO(source)
+        else:
+            self._file = source
+        self.pacing = pacing
+        self.polls = polls
+        self._memory = memory
+        self._buffer = b''
+        self._position = 0
+        self._last = 10
+        self.done = False
+        self._fill()
+
+        # Waiting for the program to finish with a line.
+        self._held = False
+        self._poll_count = 0
+        self._poll_cursor = -1
+        self._cursor = -1
+        self._echoed = False
+
+        # Bytes and lines sent so far.
+        self.sent = 0
+        self.lines = 0
+
+    def _fill(self):
+        self._buffer = self._file.read(CHUNK_SIZE)
+        self._position = 0
+        if self._buffer is None:
+            # Nothing has arrived yet on a non-blocking file.
+            self._buffer = b''
+        elif len(self._buffer) == 0:
+            if self._last != 10:
+                # Make sure there is a Line Feed at the end.
+                self._buffer = b'\n'
+            else:
+                self.close()
+
+    def _released(self):
+        if self.pacing == PROMPT:
+            return self._poll_count >= self.polls
+        if self._echoed:
+            return True
+        if self._memory is None:
+            return False
+        # The cursor has moved to another line.
+        cursor = find_cursor(self._memory)
+        return cursor >= 0 and cursor // DISPLAY_COLUMNS != self._cursor // DISPLAY_COLUMNS
+
+    def ready(self):
+        """
+        :return: True if there is a key to send
+        """
+        if self.done:
+            return False
+        if self._held:
+            if not self._released():
+                return False
+            self._held = False
+        if self._position >= len(self._buffer):
+            # Waiting for more of a non-blocking file.
+            self._fill()
+            return not self.done and self._position < len(self._buffer)
+        return True
+
+    def poll(self):
+        """
+        Called for each read of the keyboard status, which is how PROMPT pacing sees the program waiting for a key.
+
+        :return: True if there is a key to send
+        """
+        if self._held:
+            if self._memory is not None and self.pacing == PROMPT:
+                cursor = find_cursor(self._memory)
+                if cursor != self._poll_cursor:
+                    # Still printing.
+                    self._poll_cursor = cursor
+                    self._poll_count = 0
+            self._poll_count += 1
+        return self.ready()
+
+    def read(self):
+        """
+        :return: the next key, or 0 if there isn't one yet
+        """
+        if not self.ready():
+            return 0
+        key = self._buffer[self._position]
+        self._position += 1
+        if key == 13:
+            key = 10   # Ignore Carriage Returns
+        self._last = key
+        self.sent += 1
+        if self._position >= len(self._buffer):
+            # Read ahead, so the paste is done as soon as the last key is sent.
+            self._fill()
+        if key == 10:
+            self.lines += 1
+            if self.pacing != NONE:
+                self._held = True
+                self._poll_count = 0
+                self._echoed = False
+                if self._memory is not None:
+                    self._cursor = find_cursor(self._memory)
+        return key
+
+    def echo(self, value):
+        """
+        Called with each byte written to the serial port.
+        """
+        if value == 13 and self._held:
+            self._echoed = True
+
+    def close(self):
+        self.done = True
+        self._file.close()
@@ -0,0 +1,89 @@
+import sys
+import time
+
+# Bytes held before they are written out.
+BUFFER_SIZE = 65536
+
+# Seconds a finished line can wait in the buffer before it is written out.
+FLUSH_INTERVAL = 1.0
+
+
+class ParallelPrinter:
+    """
+    A printer on the parallel port that captures its output to a file or pipe.
+
+    Bytes are collected in memory and written out in large chunks, when the buffer fills, at the end of a line
+    once FLUSH_INTERVAL has passed, when poll finds them waiting longer than that and on close. With a rate the
+    printer is only ready again that long after each byte, as a real printer would be, otherwise it is always ready.
+    """
+
+    def __init__(self, path, rate=None, buffer_size=BUFFER_SIZE):
+        """
+        :param path: file to append to, '-' for stdout, or a binary file to write to, which is left open
+        :param rate: characters per second, or None for as fast as the program sends them
+        """
+        if path == '-':
+            self._file = sys.stdout.buffer
+            self._close_file = False
+        elif not isinstance(path, str):
+            self._file = path
+            self._close_file = False
+        else:
+            self._file = open(path, 'ab')
+            self._close_file = True
+        self.rate = rate
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._next_ready = 0.0
+        self._next_flush = time.monotonic() + FLUSH_INTERVAL
+
+        # Metrics.
+        self.bytes_printed = 0
+        self.flushes = 0
+
+    def ready(self):
+        """
+        :return: True if the printer can take another byte
+        """
+        return not self.rate or time.perf_counter() >= self._next_ready
+
+    def write(self, value):
+        self._buffer.append(value)
+        self.bytes_printed += 1
+        if self.rate:
+            self._next_ready = time.perf_counter() + 1 / self.rate
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        elif value == 10 or value == 13:
+            # Don't keep a finished line back for long.
+            now = time.monotonic()
+            if now >= self._next_flush:
+                self.flush()
+
+    def poll(self):
+        """
+        Write out the buffer once FLUSH_INTERVAL has passed since the last write. Called once a slice, so the last
+        line of a listing doesn't wait for the next line end.
+        """
+        if len(self._buffer) > 0 and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        self._next_flush = time.monotonic() + FLUSH_INTERVAL
+        if len(self._buffer) == 0:
+            return
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+        self.flushes += 1
+
+    def close(self):
+        self.flush()
+        if self._close_file:
+            self._file.close()
+
+    def metrics(self):
+        return {
+            'bytes_printed': self.bytes_printed,
+            'flushes': self.flushes,
+        }
@@ -0,0 +1,124 @@
+from array import array
+
+import disasm
+
+# Memory map of the Sol-20 used to label addresses in reports.
+REGIONS = (
+    (0x0000, 0xBFFF, 'RAM'),
+    (0xC000, 0xC7FF, 'SOLOS'),
+    (0xC800, 0xCBFF, 'SOLOS RAM'),
+    (0xCC00, 0xCFFF, 'VIDEO'),
+    (0xD000, 0xFFFF, 'RAM'),
+)
+
+# Jump instructions whose backward targets mark loops. Calls and returns are left out.
+JUMPS = frozenset((0xC2, 0xC3, 0xCA, 0xD2, 0xDA, 0xE2, 0xE9, 0xEA, 0xF2, 0xFA))
+
+
+class Profiler:
+    """
+    Counts executions and cycles per opcode and per address.
+
+    The profiler replaces the step method of the CPU instance while it is attached, so the CPU pays nothing
+    when profiling is off.
+    """
+
+    def __init__(self, cpu):
+        self._cpu = cpu
+        self.opcode_counts = array('Q', [0]) * 0x100
+        self.opcode_cycles = array('Q', [0]) * 0x100
+        self.address_counts = array('Q', [0]) * 0x10000
+        self.address_cycles = array('Q', [0]) * 0x10000
+
+        # Taken backward jumps keyed by (target, jump address).
+        self.loops = {}
+
+        self._step = cpu.step
+        cpu.step = self.step
+
+    def step(self):
+        cpu = self._cpu
+        pc = cpu._pc
+        cycles = cpu._cycle_base + cpu._cycles
+        self._step()
+        used = cpu._cycle_base + cpu._cycles - cycles
+        opcode = cpu._current_inst
+        self.opcode_counts[opcode] += 1
+        self.opcode_cycles[opcode] += used
+        self.address_counts[pc] += 1
+        self.address_cycles[pc] += used
+        if cpu._pc <= pc and opcode in JUMPS:
+            loop = (cpu._pc, pc)
+            self.loops[loop] = self.loops.get(loop, 0) + 1
+
+    def close(self):
+        """
+        Stop profiling. The counts are kept for reporting.
+        """
+        if self._step:
+            self._cpu.step = self._step
+            self._step = None
+
+    def report(self, top=20, labels=None):
+        """
+        Text report of the hottest addresses, loops and opcodes.
+
+        :param labels: optional dict of address to routine name
+        :return: str
+        """
+        memory = self._cpu.memory
+        total_count = sum(self.opcode_counts)
+        total_cycles = sum(self.opcode_cycles) or 1
+        lines = ['Instructions: {}  Cycles: {}'.format(total_count, total_cycles), '']
+
+        lines.append('Hottest addresses')
+        lines.append('ADDR  LABEL               COUNT        CYCLES   %CYC  INSTRUCTION')
+        hottest = sorted(range(0x10000), key=self.address_cycles.__getitem__, reverse=True)[:top]
+        for address in hottest:
+            if self.address_cycles[address] == 0:
+                break
+            lines.append('{:04X}  {:<16} {:>9} {:>13} {:>6.2f}  {}'.format(
+                address, label(address, labels), self.address_counts[address], self.address_cycles[address],
+                100.0 * self.address_cycles[address] / total_cycles, disasm.disassemble(memory, address)[0]))
+        lines.append('')
+
+        lines.append('Hottest loops')
+        lines.append('RANGE      LABEL            ITERATIONS        CYCLES   %CYC')
+        loops = []
+        for (start, end), iterations in self.loops.items():
+            loops.append((sum(self.address_cycles[start:end + 1]), start, end, iterations))
+        loops.sort(reverse=True)
+        for cycles, start, end, iterations in loops[:top]:
+            lines.append('{:04X}-{:04X}  {:<16} {:>10} {:>13} {:>6.2f}'.format(
+                start, end, label(start, labels), iterations, cycles, 100.0 * cycles / total_cycles))
+        lines.append('')
+
+        lines.append('Opcodes')
+        lines.append('OP  MNEMONIC         COUNT        CYCLES   %CYC')
+        opcodes = sorted(range(0x100), key=self.opcode_cycles.__getitem__, reverse=True)
+        for opcode in opcodes:
+            if self.opcode_counts[opcode] == 0:
+                break
+            lines.append('{:02X}  {:<10} {:>11} {:>13} {:>6.2f}'.format(
+                opcode, disasm.mnemonic(opcode), self.opcode_counts[opcode], self.opcode_cycles[opcode],
+                100.0 * self.opcode_cycles[opcode] / total_cycles))
+        return '\n'.join(lines)
+
+
+def label(address, labels=None):
+    """
+    Name an address by the nearest routine label before it, or by its region of the memory map.
+
+    :return: str such as 'SOLOS+01A3'
+    """
+    for low, high, name in REGIONS:
+        if low <= address <= high:
+            break
+    if labels:
+        candidates = [a for a in labels if low <= a <= address]
+        if candidates:
+            low = max(candidates)
+            name = labels[low]
+    if address == low:
+        return name
+    return '{}+{:04X}'.format(name, address - low)
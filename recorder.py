@@ -0,0 +1,126 @@
+import gzip
+import struct
+
+
+class ReplayException(Exception):
+    pass
+
+
+class InputRecorder:
+    """
+    Records every value returned by IO.input together with the CPU cycle count at which it was read.
+
+    The log is a gzip stream starting with a small header followed by fixed size records. Each record
+    holds the number of cycles since the previous input, the port, the value and a repeat count, so that
+    polling loops reading the same status over and over collapse into a single record.
+    """
+
+    MAGIC = b'S20R'
+    VERSION = 1
+    HEADER = struct.Struct('<4sH')
+    RECORD = struct.Struct('<QBBI')
+
+    def __init__(self, cpu, path):
+        self._cpu = cpu
+        self._io = cpu.io
+        self._file = gzip.open(path, 'wb')
+        self._file.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+
+        # The run of identical inputs not yet written out.
+        self._delta = 0
+        self._port = 0
+        self._value = 0
+        self._repeat = 0
+        self._last_cycle = cpu.cycle_count()
+
+        # Wrap the input handler of the IO instance.
+        self._input = self._io.input
+        self._io.input = self.input
+
+    def input(self, port):
+        value = self._input(port)
+        now = self._cpu.cycle_count()
+        delta = now - self._last_cycle
+        self._last_cycle = now
+        if self._repeat > 0 and delta == self._delta and port == self._port and value == self._value:
+            self._repeat += 1
+        else:
+            self._flush_run()
+            self._delta = delta
+            self._port = port
+            self._value = value
+            self._repeat = 1
+        return value
+
+    def _flush_run(self):
+        if self._repeat > 0:
+            self._file.write(self.RECORD.pack(self._delta, self._port, self._value, self._repeat))
+            self._repeat = 0
+
+    def close(self):
+        """
+        Restores the original input handler and writes out the log.
+        """
+        if self._file:
+            self._io.input = self._input
+            self._flush_run()
+            self._file.close()
+            self._file = None
+
+
+class InputReplayer:
+    """
+    Feeds the inputs stored by InputRecorder back to the CPU at exactly the cycles they were recorded.
+
+    The live input handler still runs for each input and its value is thrown away, so the tape head, keys and
+    pasted text move on as they did when recording. Once the log is exhausted the live input handler takes over
+    again.
+    """
+
+    def __init__(self, cpu, path):
+        self._cpu = cpu
+        self._io = cpu.io
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+        magic, version = InputRecorder.HEADER.unpack_from(data)
+        if magic != InputRecorder.MAGIC or version != InputRecorder.VERSION:
+            raise ReplayException('{} is not an input recording'.format(path))
+        self._records = InputRecorder.RECORD.iter_unpack(data[InputRecorder.HEADER.size:])
+
+        # The run of identical inputs being replayed.
+        self._delta = 0
+        self._port = 0
+        self._value = 0
+        self._repeat = 0
+        self._last_cycle = cpu.cycle_count()
+        self.finished = False
+
+        # Wrap the input handler of the IO instance.
+        self._input = self._io.input
+        self._io.input = self.input
+
+    def input(self, port):
+        if self._repeat == 0:
+            try:
+                self._delta, self._port, self._value, self._repeat = next(self._records)
+            except StopIteration:
+                self.close()
+                return self._input(port)
+
+        now = self._cpu.cycle_count()
+        if port != self._port or now - self._last_cycle != self._delta:
+            raise ReplayException('Replay out of sync at cycle {}: port={} expected port={} at cycle {}'.format(
+                now, hex(port), hex(self._port), self._last_cycle + self._delta))
+        self._last_cycle = now
+        self._repeat -= 1
+        # Keep the IO state in step with the recording.
+        self._input(port)
+        return self._value
+
+    def close(self):
+        """
+        Restores the original input handler.
+        """
+        if not self.finished:
+            self._io.input = self._input
+            self.finished = True
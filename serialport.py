@@ -0,0 +1,326 @@
+import os
+import select
+import socket
+import threading
+import time
+import tty
+from abc import ABC, abstractmethod
+from collections import deque
+
+import serial
+
+
+class BufferedSerial(ABC):
+    """
+    A serial line whose reading and writing happen on background threads, so the CPU thread never waits on it.
+
+    Received bytes go into a bounded receive buffer, and bytes written by the CPU into a bounded transmit buffer that
+    the writer thread sends in batches. The CPU thread only looks at the buffers, so the status port costs no system
+    calls. Bytes that arrive while a buffer is full are dropped and counted.
+
+    With a rate, bytes are passed on no faster than that many a second each way, as a real line at the configured
+    baud rate would. Without one the line runs as fast as the host can move the bytes.
+
+    Subclasses connect it to something by implementing _read, _write and _close.
+    """
+
+    # Seconds a blocking read waits, so the reader notices when it is closed.
+    READ_TIMEOUT = 0.1
+
+    # Seconds of bytes passed on at a time when the rate is limited.
+    PACING_INTERVAL = 0.01
+
+    def __init__(self, capacity=4096, rate=None):
+        """
+        :param capacity: bytes each buffer holds
+        :param rate: bytes per second each way, or None for no limit
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self._received = deque()
+        self._transmit = deque()
+        self._transmit_ready = threading.Event()
+        self._closed = False
+
+        # Metrics.
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.receive_overflows = 0
+        self.transmit_overflows = 0
+
+        self._reader = None
+        self._writer = None
+
+    def start(self):
+        """
+        Start the reader and writer threads, once the line is open.
+        """
+        self._reader = threading.Thread(target=self._read_loop, name='serial reader', daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, name='serial writer', daemon=True)
+        self._reader.start()
+        self._writer.start()
+
+    def waiting(self):
+        """
+        :return: the number of received bytes ready to read
+        """
+        return len(self._received)
+
+    def can_write(self):
+        return len(self._transmit) < self.capacity
+
+    def read_byte(self):
+        """
+        :return: the oldest received byte, or 0 if there isn't one
+        """
+        try:
+            return self._received.popleft()
+        except IndexError:
+            return 0
+
+    def write_byte(self, value):
+        if len(self._transmit) >= self.capacity:
+            self.transmit_overflows += 1
+            return
+        self._transmit.append(value)
+        if not self._transmit_ready.is_set():
+            self._transmit_ready.set()
+
+    def _pace(self, data, send):
+        """
+        Pass data to send, in pieces no faster than the rate.
+        """
+        if not self.rate:
+            send(data)
+            return
+        piece = max(1, int(self.rate * self.PACING_INTERVAL))
+        next_time = time.perf_counter()
+        for start in range(0, len(data), piece):
+            send(data[start:start + piece])
+            next_time += len(data[start:start + piece]) / self.rate
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def receive(self, data):
+        """
+        Add bytes to the receive buffer, from the reader thread.
+        """
+        space = self.capacity - len(self._received)
+        if len(data) > space:
+            self.receive_overflows += len(data) - max(space, 0)
+            data = data[:max(space, 0)]
+        self._received.extend(data)
+        self.bytes_received += len(data)
+
+    def _read_loop(self):
+        while not self._closed:
+            try:
+                data = self._read()
+            except (OSError, serial.SerialException) as e:
+                if not self._closed:
+                    print("Serial read failed: {}".format(e))
+                break
+            if data:
+                self._pace(data, self.receive)
+            elif data is None:
+                # The other end has gone.
+                break
+
+    def _write_loop(self):
+        while not self._closed:
+            self._transmit_ready.wait()
+            self._transmit_ready.clear()
+            if self._closed:
+                break
+            # Send everything written so far in one go.
+            count = len(self._transmit)
+            if count == 0:
+                continue
+            data = bytes(self._transmit.popleft() for _ in range(count))
+            try:
+                self._pace(data, self._write)
+            except (OSError, serial.SerialException) as e:
+                if not self._closed:
+                    print("Serial write failed: {}".format(e))
+                break
+            self.bytes_sent += len(data)
+
+    @abstractmethod
+    def _read(self):
+        """
+        Wait up to READ_TIMEOUT for bytes.
+
+        :return: bytes, empty if there were none, or None once the line is gone for good
+        """
+
+    @abstractmethod
+    def _write(self, data):
+        pass
+
+    def _cancel(self):
+        """
+        Wake the reader from a blocking read, if the line can.
+        """
+        pass
+
+    def _close(self):
+        pass
+
+    def close(self):
+        """
+        Stop the threads, then close the line, so no thread is still using it.
+        """
+        self._closed = True
+        self._transmit_ready.set()
+        self._cancel()
+        for thread in (self._reader, self._writer):
+            if thread and thread is not threading.current_thread():
+                thread.join(1)
+        self._close()
+
+    def metrics(self):
+        return {
+            'bytes_received': self.bytes_received,
+            'bytes_sent': self.bytes_sent,
+            'receive_overflows': self.receive_overflows,
+            'transmit_overflows': self.transmit_overflows,
+        }
+
+
+class SerialPort(BufferedSerial):
+    """
+    A host serial port, or any pyserial URL such as rfc2217:// or loop://. The port keeps to its own baud rate, so
+    there is no rate here.
+    """
+
+    def __init__(self, device, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
+                 stopbits=serial.STOPBITS_ONE, capacity=4096):
+        super().__init__(capacity)
+        self._port = serial.serial_for_url(device, baudrate=baudrate, bytesize=bytesize, parity=parity,
+                                           stopbits=stopbits, timeout=self.READ_TIMEOUT)
+        self.start()
+
+    def _read(self):
+        return self._port.read(max(1, self._port.in_waiting))
+
+    def _write(self, data):
+        self._port.write(data)
+
+    def _cancel(self):
+        # socket:// and rfc2217:// ports can't cancel a read, but their reads end within READ_TIMEOUT anyway.
+        if hasattr(self._port, 'cancel_read'):
+            self._port.cancel_read()
+
+    def _close(self):
+        self._port.close()
+
+
+class PtySerial(BufferedSerial):
+    """
+    A pseudo-terminal that terminal programs or another emulator can open as if it were a serial port. Its name is
+    in the name attribute.
+
+    The emulator keeps the terminal end open too, so programs can come and go without closing the line.
+    """
+
+    def __init__(self, capacity=4096, rate=None):
+        super().__init__(capacity, rate)
+        self._master, self._slave = os.openpty()
+        # Pass bytes through untouched, with no echo or line editing.
+        tty.setraw(self._slave)
+        self.name = os.ttyname(self._slave)
+        self.start()
+
+    def _read(self):
+        ready, _, _ = select.select([self._master], [], [], self.READ_TIMEOUT)
+        if not ready:
+            return b''
+        return os.read(self._master, self.capacity)
+
+    def _write(self, data):
+        while data:
+            data = data[os.write(self._master, data):]
+
+    def _close(self):
+        os.close(self._master)
+        os.close(self._slave)
+
+
+class TcpSerial(BufferedSerial):
+    """
+    A TCP listener on localhost that telnet, netcat and the like can connect to. One connection at a time is served,
+    and once it closes the next one is accepted. Bytes written while nothing is connected are lost, like those sent
+    down an unplugged line.
+    """
+
+    def __init__(self, port, capacity=4096, rate=None, host='127.0.0.1'):
+        super().__init__(capacity, rate)
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(1)
+        self.name = '{}:{}'.format(host, self._listener.getsockname()[1])
+        self._connection = None
+        self.start()
+
+    def _read(self):
+        if self._connection is None:
+            ready, _, _ = select.select([self._listener], [], [], self.READ_TIMEOUT)
+            if ready:
+                connection, _ = self._listener.accept()
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._connection = connection
+            return b''
+        ready, _, _ = select.select([self._connection], [], [], self.READ_TIMEOUT)
+        if not ready:
+            return b''
+        try:
+            data = self._connection.recv(self.capacity)
+        except OSError:
+            data = b''
+        if not data:
+            # Disconnected. Wait for the next connection.
+            self._connection.close()
+            self._connection = None
+        return data
+
+    def _write(self, data):
+        connection = self._connection
+        if connection is None:
+            return
+        try:
+            connection.sendall(data)
+        except OSError:
+            # The reader notices the connection has gone.
+            pass
+
+    def _close(self):
+        if self._connection:
+            self._connection.close()
+        self._listener.close()
+
+
+def open_line(device, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
+              stopbits=serial.STOPBITS_ONE, paced=True):
+    """
+    Open a serial line.
+
+    :param device: 'pty' for a pseudo-terminal, 'tcp:PORT' for a localhost TCP listener, otherwise a host serial
+        port or pyserial URL
+    :param paced: limit a pseudo-terminal or TCP line to the bytes a second of the baud rate and framing
+    :return: BufferedSerial
+    :raises ValueError: for a TCP port that isn't a number, or a URL pyserial doesn't know
+    """
+    rate = None
+    if paced:
+        # A start bit, the data bits, any parity bit and the stop bits for each byte.
+        bits = 1 + bytesize + (0 if parity == serial.PARITY_NONE else 1) + stopbits
+        rate = baudrate / bits
+    if device == 'pty':
+        return PtySerial(rate=rate)
+    if device.startswith('tcp:'):
+        if not device[4:].isdigit() or int(device[4:]) > 65535:
+            raise ValueError('tcp: needs a port number from 0 to 65535, not "{}"'.format(device[4:]))
+        return TcpSerial(int(device[4:]), rate=rate)
+    return SerialPort(device, baudrate=baudrate, bytesize=bytesize, parity=parity, stopbits=stopbits)
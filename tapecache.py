@@ -0,0 +1,172 @@
+"""
+Cache of encoded virtual tapes.
+
+The encoded tape is kept in a file next to the SVT file with an index giving the key and the place of each program
+in it. A key is the modification time and size of the file an F line refers to, or a hash of the lines of an inline
+H and D program. When the SVT file and every file it refers to are unchanged the tape is a single read. Otherwise
+only the programs whose keys changed are encoded again. A program saved to the end of the tape is appended to the
+cache in place.
+"""
+import hashlib
+import json
+import os
+import struct
+
+MAGIC = b'S20V'
+VERSION = 2
+# Magic, version, offset and length of the JSON index. The encoded tape follows the header, with the index after it.
+HEADER = struct.Struct('<4sHII')
+
+CACHE_SUFFIX = '.cache'
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _entry_key(entry, directory):
+    if len(entry) > 0 and entry[0][0] == "F":
+        path = os.path.join(directory, entry[0].split(" ")[1].lower())
+        try:
+            return [entry[0]] + _file_key(path)
+        except OSError:
+            # Encoding reports the missing file.
+            return None
+    return ['#' + hashlib.sha1('\n'.join(entry).encode()).hexdigest()]
+
+
+def _read_cache(cache_path):
+    """
+    :return: (index, encoded tape) or (None, None) if there is no usable cache
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+        magic, version, index_offset, index_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            return None, None
+        index = json.loads(data[index_offset:index_offset + index_length])
+        return index, memoryview(data)[HEADER.size:index_offset]
+    except (OSError, ValueError, struct.error):
+        return None, None
+
+
+def _write_cache(cache_path, index, tape):
+    index_bytes = json.dumps(index).encode()
+    temp_path = cache_path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, HEADER.size + len(tape), len(index_bytes)))
+            f.write(tape)
+            f.write(index_bytes)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # The cache is only an optimisation.
+        pass
+
+
+def _is_current(index, tape_key, directory):
+    if index['tape'] != tape_key:
+        return False
+    for key, offset, length in index['entries']:
+        if key is None:
+            return False
+        if len(key) == 3 and _entry_key([key[0]], directory) != key:
+            return False
+    return True
+
+
+def load_tape(io, path, tape):
+    """
+    Replace the contents of a virtual tape with the encoded programs of an SVT file.
+
+    :param io: the io8080.IO that encodes programs
+    :param tape: bytearray to fill
+    :return: the index, for append_entry
+    """
+    # F lines name files next to the SVT file.
+    directory = os.path.dirname(path)
+    cache_path = path + CACHE_SUFFIX
+    tape_key = _file_key(path)
+    index, data = _read_cache(cache_path)
+    if index and _is_current(index, tape_key, directory):
+        tape[:] = data
+        return index
+
+    cached = {}
+    if index:
+        for key, offset, length in index['entries']:
+            if key is not None:
+                cached[json.dumps(key)] = data[offset:offset + length]
+
+    with open(path, 'r') as f:
+        entries = io.read_tape_entries(f)
+    encoded = bytearray()
+    index_entries = []
+    try:
+        for entry in entries:
+            key = _entry_key(entry, directory)
+            offset = len(encoded)
+            old = cached.get(json.dumps(key)) if key else None
+            if old is not None:
+                encoded += old
+            else:
+                io.encode_tape_entry(entry, encoded, directory)
+            index_entries.append([key, offset, len(encoded) - offset])
+    except OSError:
+        # Keep the programs before a missing file, as reading the tape without a cache does.
+        tape[:] = encoded
+        raise
+
+    index = {'tape': tape_key, 'entries': index_entries}
+    _write_cache(cache_path, index, encoded)
+    tape[:] = encoded
+    return index
+
+
+def has_entry(index, line):
+    """
+    True if the tape has an F line for a file.
+    """
+    return any(key is not None and key[0] == line for key, offset, length in index['entries'])
+
+
+def append_entry(io, path, index, line, tape):
+    """
+    Add an F line for a file to the end of an SVT file and append the file to its encoded tape and cache, without
+    reading the rest of the tape again.
+
+    :param index: the index load_tape returned for the tape, updated in place
+    :return: False if the SVT file has changed since it was loaded, and the whole tape needs to be loaded again
+    """
+    if _file_key(path) != index['tape']:
+        return False
+    with open(path, 'a') as f:
+        f.write("\n")
+        f.write(line)
+
+    directory = os.path.dirname(path)
+    entry = [line]
+    offset = len(tape)
+    io.encode_tape_entry(entry, tape, directory)
+    index['entries'].append([_entry_key(entry, directory), offset, len(tape) - offset])
+    index['tape'] = _file_key(path)
+
+    # Overwrite the old index with the new program and write the index after it.
+    cache_path = path + CACHE_SUFFIX
+    index_bytes = json.dumps(index).encode()
+    try:
+        with open(cache_path, 'r+b') as f:
+            magic, version, index_offset, index_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or index_offset != HEADER.size + offset:
+                raise ValueError()
+            f.seek(index_offset)
+            f.write(tape[offset:])
+            f.write(index_bytes)
+            f.truncate()
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, HEADER.size + len(tape), len(index_bytes)))
+    except (OSError, ValueError, struct.error):
+        _write_cache(cache_path, index, tape)
+    return True
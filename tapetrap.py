@@ -0,0 +1,115 @@
+import re
+
+from loader import write_memory
+from virtualtape import BLOCK_SIZE, NAME_LENGTH, block_crc
+
+# The start of the block read routine (RDBLK) in SOLOS and CUTER: PUSH D, MVI B,3, CALL tape on, IN FB, then the
+# header read loop ending in LXI D,header buffer. Only the call targets and the buffer address differ.
+RDBLK_PATTERN = re.compile(b'\xD5\x06\x03\xCD(..)\xDB\xFB\xE5\xCD..\xE1\xDA..\xC2..\xE5\x11(..)', re.DOTALL)
+
+ROM_ADDRESS = 0xC000
+ROM_SIZE = 0x800
+
+
+class TapeTrapException(Exception):
+    pass
+
+
+class TapeTrap:
+    """
+    Loads files from the virtual tapes instantly by running the SOLOS or CUTER block read routine on the host.
+
+    The routine starts by turning the tape on with an OUT to port FA. The trap watches for that OUT coming from the
+    routine, looks the requested file up in the tape's index, checks the block CRCs, copies the data straight into
+    memory and returns to the caller with the registers and header buffer the ROM leaves behind. Anything unusual,
+    such as a missing file or a bad CRC, is left to the ROM.
+
+    With seek_only the trap just moves the tape head to the leader of the file, so the ROM reads it at normal speed
+    without first streaming the programs before it.
+    """
+
+    def __init__(self, cpu, seek_only=False):
+        self._cpu = cpu
+        self._io = cpu.io
+
+        memory = cpu.memory
+        match = RDBLK_PATTERN.search(memory, ROM_ADDRESS, ROM_ADDRESS + ROM_SIZE)
+        if not match:
+            raise TapeTrapException('No tape block read routine in the ROM')
+        tape_on = int.from_bytes(match.group(1), 'little')
+        if memory[tape_on] != 0xD3 or memory[tape_on + 1] != 0xFA:
+            raise TapeTrapException('Tape on routine at {} does not start with OUT FAH'.format(hex(tape_on)))
+
+        # The routine, where it returns to after turning the tape on and where the OUT leaves the PC.
+        self.rdblk = match.start()
+        self._tape_on_return = self.rdblk + 6
+        self._out_pc = tape_on + 2
+        self.header_address = int.from_bytes(match.group(2), 'little')
+
+        self.seek_only = seek_only
+
+        # Number of files loaded or found by the trap.
+        self.loads = 0
+
+        self._output = self._io.output
+        self._io.output = self.output
+
+    def output(self, port, value):
+        self._output(port, value)
+        cpu = self._cpu
+        if port == 0xFA and self._io.tape_on and cpu._pc == self._out_pc \
+                and cpu.read_2bytes(cpu._sp) == self._tape_on_return:
+            self._load()
+
+    def _load(self):
+        cpu = self._cpu
+        memory = cpu.memory
+        tape = self._io.current_tape
+        name = bytes(memory[cpu._hl:cpu._hl + NAME_LENGTH])
+
+        # A program the ROM would not find, past a header with a bad CRC for example, is left to the ROM.
+        tape_file = tape.find_file(name, self._io.tape_head)
+        if tape_file is None:
+            return
+        if self.seek_only:
+            self._io.tape_head = tape_file.leader_offset
+            self.loads += 1
+            return
+
+        # Check every block before touching memory.
+        data = tape_file.read_data(tape)
+        if data is None:
+            return
+        size = tape_file.size
+        address = cpu._de if cpu._de else tape_file.start_address
+        end = address + size
+        write_memory(cpu, address, data)
+        write_memory(cpu, self.header_address, tape_file.header)
+
+        # The ROM's CRC register holds the CRC of the last block, or of the header if there is no data.
+        if size > 0:
+            crc = block_crc(data[(size - 1) // BLOCK_SIZE * BLOCK_SIZE:])
+        else:
+            crc = block_crc(tape_file.header)
+
+        # Finish as the ROM does: XRA A, tape off, POP D, RET.
+        self._io.tape_head = tape_file.end_offset
+        self._output(0xFA, 0)
+        cpu._a = 0
+        cpu._sign = False
+        cpu._zero = True
+        cpu._half_carry = False
+        cpu._parity = cpu._get_parity(0)
+        cpu._carry = False
+        cpu.set_bc(crc)
+        cpu.set_de(size)
+        cpu.set_hl(end)
+        cpu._pc = cpu.read_2bytes(cpu._sp + 4)
+        cpu._sp = (cpu._sp + 6) & 0xFFFF
+        self.loads += 1
+
+    def close(self):
+        """
+        Restores the original output handler.
+        """
+        self._io.output = self._output
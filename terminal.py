@@ -0,0 +1,159 @@
+import curses
+import sys
+import time
+
+from console import COLUMNS, ROM_ADDRESS, ROWS, SCREEN_TEXT, TEXT_ADDRESS, HeadlessMachine
+
+# Least time between screen updates, in seconds, so a fast CPU doesn't flood a slow link.
+FRAME_TIME = 1 / 30
+
+# Curses keys and the Sol-20 keys they stand for.
+KEYMAP = {
+    curses.KEY_ENTER: 0x0D,
+    curses.KEY_BACKSPACE: 0x7F,
+    curses.KEY_DC: 0x7F,
+    curses.KEY_UP: 0x97,
+    curses.KEY_DOWN: 0x9A,
+    curses.KEY_RIGHT: 0x93,
+    curses.KEY_LEFT: 0x81,
+    curses.KEY_IC: 0x8C,
+    curses.KEY_HOME: 0x8E,
+    curses.KEY_END: 0x80,
+}
+
+# Mode, which also resets the tape head.
+MODE_KEY = 0x80
+
+QUIT_KEY = curses.KEY_F10
+TURBO_KEY = curses.KEY_F12
+
+
+class CursesTerminal(HeadlessMachine):
+    """
+    Shows the Sol-20 screen in a text terminal with curses, for running over SSH on a machine with no display.
+
+    The 64 x 16 video memory is drawn in scroll order, with the cursor and other characters with the top bit set in
+    reverse video. Only the cells that changed since the last frame are sent. Keys typed in the terminal go to the
+    keyboard port. F12 steps through the turbo settings and F10 quits.
+    """
+
+    def __init__(self, path, serial_device=None, serial_paced=True):
+        super().__init__(path, serial_device, serial_paced)
+        self._cpu.watch_memory(TEXT_ADDRESS, TEXT_ADDRESS + COLUMNS * ROWS - 1)
+        self._window = None
+
+        # What is on the terminal, in display order, or None before the first frame.
+        self._shown = None
+        self._shown_line = 0
+        self._shown_status = None
+        self._dirty = True
+        self._next_frame = 0.0
+
+        # Metrics.
+        self.frames = 0
+        self.cells_drawn = 0
+
+    def _screen(self):
+        """
+        :return: video memory in display order, from the scroll line on
+        """
+        memory = self._cpu.memory
+        start = TEXT_ADDRESS + (self.io.start_display_line % ROWS) * COLUMNS
+        end = TEXT_ADDRESS + COLUMNS * ROWS
+        return bytes(memory[start:end]) + bytes(memory[TEXT_ADDRESS:start])
+
+    def _draw(self):
+        """
+        Send the cells that changed since the last frame.
+        """
+        screen = self._screen()
+        shown = self._shown
+        window = self._window
+        for row in range(ROWS):
+            start = row * COLUMNS
+            line = screen[start:start + COLUMNS]
+            if shown is not None and line == shown[start:start + COLUMNS]:
+                continue
+            for column in range(COLUMNS):
+                c = line[column]
+                if shown is not None and c == shown[start + column]:
+                    continue
+                attribute = curses.A_REVERSE if c & 0x80 else curses.A_NORMAL
+                window.addch(row, column, SCREEN_TEXT[c], attribute)
+                self.cells_drawn += 1
+        self._shown = screen
+        self._shown_line = self.io.start_display_line
+        self._dirty = False
+
+        status = ' Turbo {}   F12 turbo   F10 quit'.format(self.throttle.describe())
+        if status != self._shown_status:
+            window.addstr(ROWS, 0, status.ljust(COLUMNS)[:COLUMNS], curses.A_DIM)
+            self._shown_status = status
+        window.noutrefresh()
+        curses.doupdate()
+        self.frames += 1
+
+    def _keys(self):
+        """
+        Pass the keys typed since the last slice to the keyboard port.
+
+        :return: False once the quit key is pressed
+        """
+        while True:
+            key = self._window.getch()
+            if key == -1:
+                return True
+            if key == QUIT_KEY:
+                return False
+            if key == TURBO_KEY:
+                self.throttle.next_multiplier()
+                continue
+            key = KEYMAP.get(key, key)
+            if key > 0xFF:
+                # A key the Sol-20 doesn't have.
+                continue
+            if key == MODE_KEY:
+                self.io.tape_head = 0
+            self.io.buffer_key(key)
+
+    def run(self):
+        curses.wrapper(self._run)
+
+    def _run(self, window):
+        self._window = window
+        lines, columns = window.getmaxyx()
+        if lines < ROWS + 1 or columns < COLUMNS + 1:
+            raise curses.error('The terminal must be at least {} x {}'.format(COLUMNS + 1, ROWS + 1))
+        # Control keys such as Ctrl-C and Ctrl-S go to the Sol-20, and Return is a CR.
+        curses.raw()
+        curses.nonl()
+        window.nodelay(True)
+        window.keypad(True)
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+
+        self._cpu._pc = ROM_ADDRESS
+        self.throttle.resync()
+        self._draw()
+        while self._keys():
+            self._cpu.run()
+
+            if self._cpu.has_memory_changed() or self.io.start_display_line != self._shown_line:
+                self._dirty = True
+            idle = self.idle and self.idle.idle
+            if self._dirty:
+                # Draw at most a frame every FRAME_TIME, and before sleeping.
+                now = time.perf_counter()
+                if idle or now >= self._next_frame:
+                    self._draw()
+                    self._next_frame = now + FRAME_TIME
+
+            self.io.poll_printer()
+
+            # Sleep while the program is waiting for input.
+            if idle:
+                self._sleep(sys.stdin.fileno())
+
+            self.throttle.pace()
@@ -0,0 +1,59 @@
+import time
+
+from cpu import CLOCK_HZ
+
+
+class Throttle:
+    """
+    Paces the CPU to the real Sol-20 clock rate, or a multiple of it, using the cycles the opcodes count.
+
+    After a stall the CPU runs flat out to catch up, unless it fell more than max_lag seconds behind, in which
+    case the lost time is written off.
+    """
+
+    # Turbo settings in the order the turbo key steps through them. None is unlimited.
+    MULTIPLIERS = (1, 2, 4, None)
+
+    def __init__(self, cpu, multiplier=1, max_lag=0.25):
+        self._cpu = cpu
+        self.multiplier = multiplier
+        self.max_lag = max_lag
+        self.resync()
+
+    def resync(self):
+        """
+        Start pacing afresh from the current time and cycle count.
+        """
+        self._start_time = time.perf_counter()
+        self._start_cycles = self._cpu.cycle_count()
+
+    def set_multiplier(self, multiplier):
+        self.multiplier = multiplier
+        self.resync()
+
+    def next_multiplier(self):
+        """
+        Step to the next turbo setting.
+
+        :return: the new multiplier
+        """
+        index = self.MULTIPLIERS.index(self.multiplier) if self.multiplier in self.MULTIPLIERS else -1
+        self.set_multiplier(self.MULTIPLIERS[(index + 1) % len(self.MULTIPLIERS)])
+        return self.multiplier
+
+    def describe(self):
+        return 'unlimited' if self.multiplier is None else '{}x'.format(self.multiplier)
+
+    def pace(self):
+        """
+        Sleep until real time catches up with the cycles the CPU has run.
+        """
+        if self.multiplier is None:
+            return
+        cycles = self._cpu.cycle_count() - self._start_cycles
+        target = self._start_time + cycles / (CLOCK_HZ * self.multiplier)
+        now = time.perf_counter()
+        if target > now:
+            time.sleep(target - now)
+        elif now - target > self.max_lag:
+            self.resync()
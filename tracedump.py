@@ -0,0 +1,55 @@
+"""
+Decode and disassemble an instruction trace written by tracer.Tracer.
+
+    python tracedump.py trace.bin [--last N]
+"""
+from argparse import ArgumentParser
+
+import disasm
+from tracer import Tracer
+
+
+class TraceException(Exception):
+    pass
+
+
+def read_trace(path):
+    """
+    Decode a trace file.
+
+    :return: list of (pc, opcode, byte1, byte2, a, flags, sp, cycles) tuples, oldest first
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, record_size, count = Tracer.HEADER.unpack_from(data)
+    if magic != Tracer.MAGIC or version != Tracer.VERSION or record_size != Tracer.RECORD.size:
+        raise TraceException('{} is not an instruction trace'.format(path))
+    return list(Tracer.RECORD.iter_unpack(data[Tracer.HEADER.size:Tracer.HEADER.size + count * record_size]))
+
+
+def format_record(record):
+    pc, opcode, byte1, byte2, a, flags, sp, cycles = record
+    length = disasm.MNEMONICS[opcode][1]
+    data = byte1 if length == 2 else byte1 + (byte2 << 8)
+    code = ' '.join('{:02X}'.format(b) for b in (opcode, byte1, byte2)[:length])
+    return '{:04X}  {:<9} {:<14} A={:02X} F={}{}{}{}{} SP={:04X} {:>2}'.format(
+        pc, code, disasm.format_instruction(opcode, data), a,
+        'S' if flags & 0x80 else '-', 'Z' if flags & 0x40 else '-', 'H' if flags & 0x10 else '-',
+        'P' if flags & 0x04 else '-', 'C' if flags & 0x01 else '-', sp, cycles)
+
+
+def main():
+    arg_parser = ArgumentParser(description='Disassemble a Sol-20 instruction trace')
+    arg_parser.add_argument('filename', help='Trace file')
+    arg_parser.add_argument('--last', type=int, help='Only show the last N instructions')
+    args = arg_parser.parse_args()
+
+    records = read_trace(args.filename)
+    if args.last:
+        records = records[-args.last:]
+    for record in records:
+        print(format_record(record))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import struct
+
+from cpu import MAX_CYCLES, EndSlice, InvalidInstruction, StackException
+
+
+class Tracer:
+    """
+    Records every executed instruction into a preallocated ring of fixed size binary records.
+
+    Each record holds the address, opcode and the two bytes following it, then A, the flags and SP after the
+    instruction ran and the cycles it took. The tracer replaces the run and step methods of the CPU instance
+    while it is attached, so the CPU pays nothing when tracing is off. Use tracedump.py to decode a dump.
+    """
+
+    MAGIC = b'S20T'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHI')
+    RECORD = struct.Struct('<HBBBBBHB')
+
+    def __init__(self, cpu, capacity=65536, path=None):
+        """
+        :param capacity: number of instructions kept
+        :param path: file the trace is dumped to on demand and when the CPU raises InvalidInstruction or StackException
+        """
+        self._cpu = cpu
+        self._buffer = bytearray(self.RECORD.size * capacity)
+        self._offset = 0
+        self._wrapped = False
+        self.path = path
+
+        # Whether run and step had already been replaced, by the profiler or the debugger, when tracing started.
+        self._had_run = 'run' in cpu.__dict__
+        self._had_step = 'step' in cpu.__dict__
+        self._run = cpu.run
+        self._step = cpu.step
+        cpu.run = self.run
+        cpu.step = self.step
+
+    def run(self, steps=MAX_CYCLES):
+        """
+        Same as CPU.run with the fetch and dispatch of CPU.step inlined to keep the cost of tracing down.
+
+        When step has been replaced by something else, such as the profiler or the debugger, it is called for every
+        instruction instead so that it still sees them all.
+        """
+        try:
+            if self._had_step or self._cpu.step != self.step:
+                step = self._cpu.step
+                for _ in range(steps):
+                    step()
+            else:
+                self._execute(steps)
+        except EndSlice:
+            pass
+
+    def step(self):
+        if self._had_step:
+            self._record_step()
+        else:
+            self._execute(1)
+
+    def _execute(self, steps):
+        cpu = self._cpu
+        memory = cpu._memory
+        instructions = cpu._instructions
+        buffer = self._buffer
+        pack_into = self.RECORD.pack_into
+        size = self.RECORD.size
+        end = len(buffer)
+        offset = self._offset
+        try:
+            for _ in range(steps):
+                pc = cpu._pc
+                cycles = cpu._cycles
+                opcode = memory[pc]
+                cpu._pc = pc + 1
+                cpu._current_inst = opcode
+                instructions[opcode]()
+                cpu._count += 1
+                pack_into(buffer, offset, pc, opcode, memory[(pc + 1) & 0xFFFF], memory[(pc + 2) & 0xFFFF],
+                          cpu._a,
+                          cpu._sign << 7 | cpu._zero << 6 | cpu._half_carry << 4 | cpu._parity << 2 | 0x02 | cpu._carry,
+                          cpu._sp, cpu._cycles - cycles)
+                offset += size
+                if offset == end:
+                    offset = 0
+                    self._wrapped = True
+                if cpu._cycles >= MAX_CYCLES:
+                    cpu._end_slice()
+        except (InvalidInstruction, StackException):
+            # Keep the instruction that failed, the last one in the dump.
+            self._offset = offset
+            self._record(pc, opcode, cpu._cycles - cycles)
+            if self.path:
+                self.dump()
+            raise
+        except EndSlice:
+            self._offset = offset
+            raise
+        self._offset = offset
+
+    def _record_step(self):
+        """
+        Run the step that was in place before tracing started and record the instruction.
+        """
+        cpu = self._cpu
+        pc = cpu._pc
+        cycles = cpu._cycle_base + cpu._cycles
+        opcode = cpu._memory[pc]
+        try:
+            self._step()
+        except (InvalidInstruction, StackException):
+            self._record(pc, opcode, cpu._cycle_base + cpu._cycles - cycles)
+            if self.path:
+                self.dump()
+            raise
+        self._record(pc, opcode, cpu._cycle_base + cpu._cycles - cycles)
+
+    def _record(self, pc, opcode, cycles):
+        cpu = self._cpu
+        memory = cpu._memory
+        self.RECORD.pack_into(self._buffer, self._offset, pc, opcode, memory[(pc + 1) & 0xFFFF],
+                              memory[(pc + 2) & 0xFFFF], cpu._a,
+                              cpu._sign << 7 | cpu._zero << 6 | cpu._half_carry << 4 | cpu._parity << 2 | 0x02 |
+                              cpu._carry, cpu._sp, cycles & 0xFF)
+        self._offset += self.RECORD.size
+        if self._offset == len(self._buffer):
+            self._offset = 0
+            self._wrapped = True
+
+    def records(self):
+        """
+        The recorded instructions, oldest first, as raw bytes.
+        """
+        if self._wrapped:
+            return self._buffer[self._offset:] + self._buffer[:self._offset]
+        return self._buffer[:self._offset]
+
+    def dump(self, path=None):
+        """
+        Write the recorded instructions to a file, by default the one given when tracing started.
+        """
+        records = self.records()
+        with open(path or self.path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.RECORD.size, len(records) // self.RECORD.size))
+            f.write(records)
+
+    def close(self):
+        """
+        Stop tracing. The records are kept for dumping.
+        """
+        if self._run:
+            cpu = self._cpu
+            if self._had_run:
+                cpu.run = self._run
+            else:
+                del cpu.run
+            if self._had_step:
+                cpu.step = self._step
+            else:
+                del cpu.step
+            self._run = None
+            self._step = None
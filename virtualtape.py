@@ -0,0 +1,260 @@
+"""
+Virtual cassette tapes.
+
+A tape is either an SVT text file listing its programs, or a compact SVB file holding the encoded tape bytes
+after a 4 byte magic. To make an SVB file from an SVT file:
+
+    python virtualtape.py TAPEs/TAPE1.svt TAPEs/TAPE1.svb
+"""
+import os
+from argparse import ArgumentParser
+
+import tapecache
+
+SVB_MAGIC = b'SVB1'
+
+HEADER_SIZE = 16
+BLOCK_SIZE = 256
+
+# Offsets into a tape header.
+NAME_LENGTH = 5
+TYPE_OFFSET = 6
+SIZE_OFFSET = 7
+START_OFFSET = 9
+EXEC_OFFSET = 11
+
+
+class TapeException(Exception):
+    pass
+
+
+def block_crc(data, crc=0):
+    """
+    The SOLOS tape CRC of a block, the same as applying IO.calculate_crc to each byte.
+    """
+    return (crc - sum(data) - len(data)) & 0xFF
+
+
+def find_header(tape, position):
+    """
+    Search for a header the way the ROM does: at least 10 nulls, then 01, then the header and its CRC.
+
+    :return: (header, CRC matches, offset of the header) or None at the end of the tape
+    """
+    while True:
+        position = tape.find(b'\x00' * 10, position)
+        if position < 0:
+            return None
+        position += 10
+        while position < len(tape) and tape[position] == 0:
+            position += 1
+        if position >= len(tape):
+            return None
+        if tape[position] != 0x01:
+            position += 1
+            continue
+        position += 1
+        if position + HEADER_SIZE >= len(tape):
+            return None
+        header = bytes(tape[position:position + HEADER_SIZE])
+        return header, block_crc(header) == tape[position + HEADER_SIZE], position
+
+
+class TapeFile:
+    """
+    A program on a virtual tape.
+    """
+
+    def __init__(self, header, crc_ok, leader_offset, header_offset):
+        """
+        :param leader_offset: where a search for this header starts, the end of the program before it
+        :param header_offset: offset of the 16 header bytes
+        """
+        self.header = header
+        self.crc_ok = crc_ok
+        self.name = header[:NAME_LENGTH]
+        self.type = header[TYPE_OFFSET]
+        self.size = header[SIZE_OFFSET] + (header[SIZE_OFFSET + 1] << 8)
+        self.start_address = header[START_OFFSET] + (header[START_OFFSET + 1] << 8)
+        self.exec_address = header[EXEC_OFFSET] + (header[EXEC_OFFSET + 1] << 8)
+        self.leader_offset = leader_offset
+        self.header_offset = header_offset
+
+        # The data follows the header CRC, with a CRC after every block of 256 bytes.
+        self.data_offset = header_offset + HEADER_SIZE + 1
+        self.end_offset = self.data_offset + self.size + (self.size + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+    def __repr__(self):
+        return '{} {} {:04X} {:04X} at {}'.format(self.name.rstrip(b'\x00').decode('latin1'), chr(self.type),
+                                                 self.size, self.start_address, self.header_offset)
+
+    def read_data(self, tape):
+        """
+        The data blocks with their CRCs checked.
+
+        :return: bytearray, or None if the tape ends early or a CRC is wrong
+        """
+        data = bytearray()
+        position = self.data_offset
+        while len(data) < self.size:
+            length = min(BLOCK_SIZE, self.size - len(data))
+            if position + length >= len(tape):
+                return None
+            block = tape[position:position + length]
+            if block_crc(block) != tape[position + length]:
+                return None
+            data += block
+            position += length + 1
+        return data
+
+
+def index_tape(tape, position=0):
+    """
+    Find every program on a tape from a position. A header with a bad CRC ends the index, as its size can not be
+    trusted.
+
+    :return: list of TapeFile
+    """
+    files = []
+    while True:
+        found = find_header(tape, position)
+        if found is None:
+            break
+        header, crc_ok, header_offset = found
+        tape_file = TapeFile(header, crc_ok, position, header_offset)
+        files.append(tape_file)
+        if not crc_ok:
+            break
+        position = tape_file.end_offset
+    return files
+
+
+def tape_path(base):
+    """
+    The SVB file for a tape if there is one, otherwise the SVT file.
+    """
+    return base + ".svb" if os.path.exists(base + ".svb") else base + ".svt"
+
+
+def read_svb(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(SVB_MAGIC)] != SVB_MAGIC:
+        raise TapeException('{} is not an SVB tape'.format(path))
+    return memoryview(data)[len(SVB_MAGIC):]
+
+
+def write_svb(path, tape):
+    with open(path, 'wb') as f:
+        f.write(SVB_MAGIC)
+        f.write(tape)
+
+
+class VirtualTape(bytearray):
+    """
+    The encoded contents of a virtual cassette, read from its SVT file the first time the tape is turned on.
+    """
+
+    def __init__(self, number, path):
+        super().__init__()
+        self.number = number
+        self.path = path
+
+        # Where the files named on F lines are, and where programs saved to the tape go.
+        self.directory = os.path.dirname(path)
+        self.mounted = False
+
+        # Index of the programs on the tape.
+        self.files = []
+
+        # Index of the SVT entries in the tape cache.
+        self.cache_index = None
+
+    def mount(self, io):
+        """
+        Load the tape if this is the first time it has been used.
+        """
+        if not self.mounted:
+            self.mounted = True
+            self.reload(io)
+
+    def reload(self, io):
+        self.clear()
+        self.cache_index = None
+        try:
+            if self.path.endswith(".svb"):
+                self[:] = read_svb(self.path)
+            else:
+                self.cache_index = tapecache.load_tape(io, self.path, self)
+        except FileNotFoundError:
+            print("There is no virtual cassette tape {}.".format(self.number))
+        self.files = index_tape(self)
+
+    def add_file(self, io, file_name):
+        """
+        Add a file just saved to this tape. A new file is appended to the SVT file, the tape, the index and the
+        cache. Saving over a file already on the tape loads the tape again.
+        """
+        line = "F " + file_name.upper()
+        if self.path.endswith(".svb"):
+            # The encoded program just goes on the end.
+            end = len(self)
+            io.encode_tape_entry([line], self, self.directory)
+            with open(self.path, 'ab') as f:
+                f.write(self[end:])
+            self._index_from(end)
+            return
+        if self.cache_index is not None:
+            if tapecache.has_entry(self.cache_index, line):
+                self.reload(io)
+                return
+            end = len(self)
+            if tapecache.append_entry(io, self.path, self.cache_index, line, self):
+                self._index_from(end)
+                return
+
+        # The SVT file has changed since it was loaded. See if the file is already in it and add it if it isn't.
+        with open(self.path, 'r') as f:
+            has_file_name = any(line == entry_line.strip().upper() for entry_line in f)
+        if not has_file_name:
+            with open(self.path, 'a') as f:
+                f.write("\n")
+                f.write(line)
+        self.reload(io)
+
+    def _index_from(self, end):
+        # Index programs added after the old end of the tape.
+        if len(self.files) == 0 or self.files[-1].crc_ok:
+            self.files += index_tape(self, self.files[-1].end_offset if self.files else end)
+
+    def find_file(self, name, position=0):
+        """
+        The first program with a name, as a search from a position on the tape would find it.
+
+        :param name: the first 5 bytes of a header
+        :return: TapeFile or None
+        """
+        for tape_file in self.files:
+            if tape_file.leader_offset >= position and tape_file.name == name:
+                return tape_file
+        return None
+
+
+def main():
+    arg_parser = ArgumentParser(description='Encode an SVT virtual tape into a compact SVB tape')
+    arg_parser.add_argument('svt', help='SVT file')
+    arg_parser.add_argument('svb', help='SVB file to write')
+    args = arg_parser.parse_args()
+
+    import io8080
+    io = io8080.IO()
+    tape = bytearray()
+    with open(args.svt, 'r') as f:
+        io.load_virtual_tape(f, tape, os.path.dirname(args.svt))
+    write_svb(args.svb, tape)
+    for tape_file in index_tape(tape):
+        print(tape_file)
+
+
+if __name__ == '__main__':
+    main()